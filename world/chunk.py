@@ -3,6 +3,7 @@ This module contains the Chunk and ChunkSection classes.
 """
 
 import math
+import sys
 import numpy
 from . import nbt
 from . import blockregistry
@@ -25,6 +26,52 @@ def chunk_block_index(*args):
     else:
         return args[0][1]*256+args[0][2]*16+args[0][0]
 
+def unpack_longs(longs : numpy.ndarray, bitsize : int, count : int) -> numpy.ndarray:
+    """
+    Unpacks `count` values of `bitsize` bits from an array of longs, where each
+    long holds 64 // bitsize values starting from its lowest bits and values do
+    not span two longs. This is how BlockStates and Heightmaps are packed.
+    : longs :   The packed longs. Big-endian ones (such as t_longs.data) are byte swapped first.
+    Returns an array of uint64.
+    """
+    vpl = 64 // bitsize
+    shifts = numpy.arange(vpl, dtype=numpy.uint64) * numpy.uint64(bitsize)
+    # This is a no-op for native-endian longs, and swaps the bytes of big-endian ones.
+    longs = numpy.ascontiguousarray(longs, dtype=numpy.int64).view(numpy.uint64)
+    # Every long is shifted by every offset at once, giving one row of values per long.
+    values = longs[:, None] >> shifts
+    values &= numpy.uint64((1 << bitsize) - 1)
+    return values.reshape(-1)[:count]
+
+def pack_longs(values : numpy.ndarray, bitsize : int) -> numpy.ndarray:
+    """
+    Packs values into an array of native-endian longs. The opposite of unpack_longs().
+    """
+    vpl = 64 // bitsize
+    size = -(-len(values) // vpl)
+    padded = numpy.zeros(size * vpl, dtype=numpy.uint64)
+    padded[:len(values)] = values
+    padded &= numpy.uint64((1 << bitsize) - 1)
+    shifts = numpy.arange(vpl, dtype=numpy.uint64) * numpy.uint64(bitsize)
+    return numpy.bitwise_or.reduce(padded.reshape(size, vpl) << shifts, axis=1).view(numpy.int64)
+
+def unpack_nibbles(arr : numpy.ndarray) -> numpy.ndarray:
+    """
+    Splits each byte of arr into two 4-bit values, low bits first, as BlockLight
+    and SkyLight are stored.
+    """
+    result = numpy.empty(len(arr) * 2, dtype='>i1')
+    result[0::2] = arr & 0x0F
+    result[1::2] = (arr >> 4) & 0x0F
+    return result
+
+def pack_nibbles(arr : numpy.ndarray) -> numpy.ndarray:
+    """
+    Packs pairs of 4-bit values into bytes. The opposite of unpack_nibbles().
+    """
+    arr = arr.astype(numpy.uint8)
+    return (arr[0::2] & 0x0F) | ((arr[1::2] & 0x0F) << 4)
+
 def extract_index(full_index, palette_size, block_states):
     bitsize = max((palette_size - 1).bit_length(), 4)
     #vpl = values per long
@@ -45,10 +92,12 @@ def inject_index(full_index, palette_size, block_states, value):
     state_index = full_index // vpl
     #value_offset represents the number of bits to shift to form our mask for setting the value.
     value_offset = (full_index % vpl) * bitsize
-    #block_state will be a 64 bit integer
-    block_state = block_states[state_index]
+    #block_state will be a 64 bit integer. It is done with Python ints, which can not
+    #overflow, and then wrapped back to a signed long.
+    block_state = int(block_states[state_index]) & 0xFFFFFFFFFFFFFFFF
     #Injecting our value to the block_state
-    block_states[state_index] = (block_state & ~(mask << value_offset)) | (value << value_offset)
+    block_state = (block_state & ~(mask << value_offset)) | (masked_value << value_offset)
+    block_states[state_index] = block_state - (1 << 64) if block_state >= (1 << 63) else block_state
 
 def calc_blockstates_size(palette_size):
     bitsize = max((palette_size - 1).bit_length(), 4)
@@ -66,39 +115,33 @@ class ChunkSection:
         if 'Y' in section_tag:
             y = section_tag['Y'].value
 
-        tmp = section_tag['BlockLight']
+        tmp = section_tag.get('BlockLight')
         if tmp is not None:
-            blocklight = numpy.zeros(shape=(4096,), dtype='>i1')
-            for i in range(2048):
-                blocklight[i*2] = tmp.data[i] & 0x0F
-                blocklight[i*2+1] = (tmp.data[i] >> 4) & 0x0F
-        tmp = section_tag['SkyLight']
+            blocklight = unpack_nibbles(tmp.data)
+        tmp = section_tag.get('SkyLight')
         if tmp is not None:
-            skylight = numpy.zeros(shape=(4096,), dtype='>i1')
-            for i in range(2048):
-                skylight[i*2] = tmp.data[i] & 0x0F
-                skylight[i*2+1] = (tmp.data[i] >> 4) & 0x0F
+            skylight = unpack_nibbles(tmp.data)
         #   I can make BlockStates an array with a size of 4096 for ease of use.
         #   I can also translate the palette into some other data structure.
         
         blocks = None
-        states_tag = section_tag['BlockStates']
-        palette = section_tag['Palette']
+        states_tag = section_tag.get('BlockStates')
+        palette = section_tag.get('Palette')
 
         
         if palette is not None and states_tag is not None:
             states = list()
-            blocks = numpy.ndarray(shape=(4096,),dtype=numpy.object_)
-            for v in palette.data:
+            for v in palette:
                 name = v.Name.value
                 props = {}
                 if 'Properties' in v:
-                    props = { k : val.value for k, val in v.Properties.data.items() }
+                    props = { k : val.value for k, val in v.Properties.items() }
                 states.append(blockregistry.register(name, props))
             
-            for i in range(4096):
-                ind = extract_index(i, len(palette.data), states_tag.data)
-                blocks[i] = states[ind].unique_key
+            keys = numpy.ndarray(shape=(len(states),), dtype=numpy.object_)
+            keys[:] = [state.unique_key for state in states]
+            bitsize = max((len(states) - 1).bit_length(), 4)
+            blocks = keys[unpack_longs(states_tag.data, bitsize, 4096)]
         
         return ChunkSection(y, blocks, blocklight, skylight)
 
@@ -109,35 +152,40 @@ class ChunkSection:
         self.BlockLight = blocklight
         self.SkyLight = skylight
     
+    @property
+    def nbytes(self) -> int:
+        """
+        An estimate of the memory held by this section, in bytes.
+        Blocks holds keys into the block registry, which are shared between
+        sections and are not counted.
+        """
+        size = sys.getsizeof(self)
+        for arr in (self.Blocks, self.BlockLight, self.SkyLight):
+            if arr is not None:
+                size += nbt._array_nbytes(arr)
+        return size
+    
     def to_nbt(self):
 
         tag_items = {}
 
         if self.BlockLight is not None:
-            blocklight = nbt.t_bytes(numpy.zeros(2048, dtype='>u1'))
-            for i in range(2048):
-                blocklight[i] = (self.BlockLight[i*2] & 0x0F) | ((self.BlockLight[i*2+1] & 0x0F) << 4)
-            tag_items['BlockLight'] = blocklight
+            tag_items['BlockLight'] = nbt.t_bytes(pack_nibbles(self.BlockLight))
 
         if self.Blocks is not None:
             palette = [blockregistry.find(x) for x in set(self.Blocks)]
             palette_table = { v.unique_key : i for i, v in enumerate(palette) if v is not None }
-            states = numpy.zeros(shape=(calc_blockstates_size(len(palette))), dtype='>i8')
-
-            for i in range(4096):
-                inject_index(i, len(palette), states, palette_table[self.Blocks[i]])
+            indices = numpy.fromiter((palette_table[key] for key in self.Blocks), dtype=numpy.uint64, count=4096)
+            bitsize = max((len(palette) - 1).bit_length(), 4)
             
-            tag_items['BlockStates'] = nbt.t_longs(states)
+            tag_items['BlockStates'] = nbt.t_longs(pack_longs(indices, bitsize))
 
             palette_items = [blockregistry.BlockState.to_nbt(v) for v in palette]
 
             tag_items['Palette'] = nbt.t_list(nbt.t_compound, palette_items)
 
         if self.SkyLight is not None:
-            skylight = nbt.t_bytes(numpy.zeros(2048, dtype='>u1'))
-            for i in range(2048):
-                skylight[i] = (self.SkyLight[i*2] & 0x0F) | ((self.SkyLight[i*2+1] & 0x0F) << 4)
-            tag_items['SkyLight'] = skylight
+            tag_items['SkyLight'] = nbt.t_bytes(pack_nibbles(self.SkyLight))
         
         if self.Y is not None:
             tag_items['Y'] = nbt.t_byte(self.Y)
@@ -166,55 +214,15 @@ class Heightmaps:
         """
         This function will take a numpy array of longs and convert it to 256 unsigned int16s representing the heights.
         """
-        result = numpy.zeros(shape=(256,), dtype=numpy.uint16)
-        #   This is a tough one-liner, so let me break it down.
-        #   There should be 37 values in arr with 7 values packed into each.
-        #   So in order extract a value by index, we must figure out the index within arr first.
-        #   To do that, we simply use the floor division operator to divide the full index by 7.
-        #   Example:
-        #       >>> 43 // 7
-        #       6
-        #   This means that the index in the array that we will find our value is 6.
-        #   Next, we must extract from the value at that index.
-        #   To do so, we create a bit mask of 9 bits. (0b111111111 or 0x1ff)
-        #   We need to shift that mask to the bits that represent the value we want to extract.
-        #   To get the number of bits to shift, you simply modulo our full index by 7.
-        #       >>> 43 % 7
-        #       1
-        #   So now we know that the index should be 1.
-        #   We multiply that value by 9 to get our shift count.
-        #       >>> 1 * 9
-        #       9
-        #   We'll need to use this same value later to shift our value BACK to the 0 index.
-        #   We now can left-shift our mask by 9 bits.
-        #       >>> 0x1FF << 9
-        #       261632
-        #   With our new bit mask, we simply apply the bitwise AND operator with our arr value.
-        #       >>> arr[6] & 261632
-        #   We can then get our final value by right-shifting back to 0. Remember that value from earlier?
-        #       >>> (arr[6] & 261632) >> 9
-        #   And that is how this one-liner works.
-        #   I know this comment seems excessive, but I would hate for anyone to look at this gargantuan
-        #   one-liner and think to themselves "What the fuck does this even do?"
-        #   The answer to that question is that it extracts a 9-bit value from a 64-bit value within an
-        #   array of 64-bit values.
-        extract = lambda index: (result[index // 7] & (0x1FF << ((index % 7) * 9))) >> ((index % 7) * 9)
-        for i in range(256):
-            result[i] = extract(i)
-        return result
+        #   There are 37 longs in arr with 7 values of 9 bits packed into each, starting from the lowest bits.
+        #   So the value at index 43 is in arr[43 // 7], shifted left by (43 % 7) * 9 bits.
+        #   unpack_longs does that for every value at once.
+        return unpack_longs(arr, 9, 256).astype(numpy.uint16)
     
     @staticmethod
     def pack_heightmap(arr):
-        mask = 0x1FF
-        result = numpy.zeros(shape=(37,), dtype=numpy.int64)
-        # This does the opposite of what extract does in unpack_heightmap.
-        # this will return a new 63 bit (or less) long value with value injected at index.
-        inject = lambda long, index, value: (long & ~(0x1FF << (index * 9))) | (value << (index * 9))
-        for i in range(256):
-            resindex = i // 7
-            subind = i % 7
-            result[resindex] = inject(result[resindex], subind, arr[i])
-        return result
+        # This does the opposite of unpack_heightmap, returning 37 longs.
+        return pack_longs(arr, 9)
         
 
     __slots__ = ('ocean_floor', 'motion_blocking_no_leaves', 'motion_blocking', 'world_surface')
@@ -226,7 +234,12 @@ class Heightmaps:
         self.world_surface = Heightmaps.unpack_heightmap(heightmaps_tag['WORLD_SURFACE'].data)
     
     def to_nbt(self):
-        pass
+        return nbt.t_compound({
+            'OCEAN_FLOOR' : nbt.t_longs(Heightmaps.pack_heightmap(self.ocean_floor)),
+            'MOTION_BLOCKING_NO_LEAVES' : nbt.t_longs(Heightmaps.pack_heightmap(self.motion_blocking_no_leaves)),
+            'MOTION_BLOCKING' : nbt.t_longs(Heightmaps.pack_heightmap(self.motion_blocking)),
+            'WORLD_SURFACE' : nbt.t_longs(Heightmaps.pack_heightmap(self.world_surface))
+        })
 
 
 # TODO: Refactor Chunk to be able to load directly from stream rather than from NBT.
@@ -248,7 +261,8 @@ class Chunk:
     #   Lights (I believe this is used for worldgen)
     #   LiquidsToBeTicked
     def __init__(self, chunk_tag):
-        chunk_tag = chunk_tag['']
+        if '' in chunk_tag:
+            chunk_tag = chunk_tag['']
         self.isDirty = False
         self.DataVersion = chunk_tag['DataVersion'].value
         level_tag = chunk_tag['Level']
@@ -263,7 +277,7 @@ class Chunk:
 
         self.Sections = dict()
 
-        for section in sections.data:
+        for section in sections:
             tmp = ChunkSection.from_nbt(section)
             self.Sections[tmp.Y] = tmp
         self.tags = Chunk.Tags()
@@ -273,6 +287,21 @@ class Chunk:
             else:
                 setattr(self.tags, slot, None)
 
+    @property
+    def nbytes(self) -> int:
+        """
+        An estimate of the memory held by this chunk, in bytes, including its
+        sections and the tags it keeps from its NBT.
+        """
+        size = sys.getsizeof(self) + sys.getsizeof(self.Sections) + sys.getsizeof(self.tags)
+        for section in self.Sections.values():
+            size += section.nbytes
+        for key in Chunk.Tags.__slots__:
+            tag = getattr(self.tags, key, None)
+            if tag is not None:
+                size += tag.nbytes
+        return size
+
     def to_nbt(self):
         items = {}
         items['DataVersion'] = nbt.t_int(self.DataVersion)
@@ -290,8 +319,10 @@ class Chunk:
         level_data['InhabitedTime'] = nbt.t_long(self.InhabitedTime)
         level_data['LastUpdate'] = nbt.t_long(self.LastUpdate)
 
-        for key in Chunk._level_tag_slots:
-            tmp = getattr(self, key, None)
+        # These tags are passed through untouched, so unless they were modified they
+        # keep the bytes they were parsed from and are not re-encoded by nbt.dump.
+        for key in Chunk.Tags.__slots__:
+            tmp = getattr(self.tags, key, None)
             if tmp is not None:
                 level_data[key] = tmp
         
@@ -14,6 +14,14 @@ load(data) requires that data be of type bytes. This function returns an nbt tag
 from abc import ABC, abstractmethod
 import struct
 import io
+import array
+import hashlib
+import weakref
+import math
+import zlib
+import sys
+import re
+import os
 from functools import partial
 import typing
 import numpy
@@ -29,11 +37,30 @@ __all__ = [
     't_string',
     't_list',
     't_compound',
+    't_lazy_compound',
     't_bytes',
     't_ints', 
     't_longs',
     'load',
     'dump',
+    'clear_string_pool',
+    'load_native',
+    'dump_native',
+    'load_file',
+    'dump_file',
+    'nbt_writer',
+    'iterparse',
+    'diff',
+    'apply_patch',
+    'encode_patch',
+    'decode_patch',
+    'nbt_query',
+    'compile_query',
+    'patch_scalar',
+    'nbytes_report',
+    'write_snbt',
+    'dumps',
+    'loads',
     '_read_byte',
     '_read_short',
     '_read_ushort',
@@ -67,29 +94,244 @@ def _read_double(stream):
 
 def _read_string(stream):
     length = _read_ushort(stream)
-    return stream.read(length).decode('utf-8')
+    return _decode_string(stream.read(length))
+
+def _decode_string(raw) -> str:
+    """
+    Decodes the UTF-8 bytes `raw`.
+    Short strings (such as compound keys and block names) are interned and kept in
+    a bounded pool keyed on their raw bytes, so that a string that repeats across
+    chunks is only decoded once and every occurrence shares one str object.
+    """
+    if len(raw) > _string_pool_max_length:
+        return str(raw, 'utf-8')
+    try:
+        value = _string_pool.get(raw, None)
+    except (TypeError, ValueError):
+        # Slices of mutable buffers can not be hashed.
+        raw = bytes(raw)
+        value = _string_pool.get(raw, None)
+    if value is None:
+        value = sys.intern(str(raw, 'utf-8'))
+        if len(_string_pool) >= _string_pool_size:
+            _string_pool.clear()
+        _string_pool[bytes(raw)] = value
+    return value
+
+def clear_string_pool():
+    """
+    Empties the pool of decoded strings that is shared by every load.
+    """
+    _string_pool.clear()
+
+def _read_array(stream, dtype, count):
+    """
+    Reads `count` elements of `dtype` from `stream` as a single numpy buffer.
+    The returned array is a read-only view over the bytes that were read, so
+    no per-element work is done in Python.
+    """
+    return numpy.frombuffer(stream.read(count * dtype.itemsize), dtype=dtype)
+
+def _array_nbytes(arr : numpy.ndarray) -> int:
+    """
+    Returns the size of a numpy array including its buffer, which sys.getsizeof
+    leaves out for arrays that view another object's memory.
+    """
+    if arr.base is None:
+        return sys.getsizeof(arr)
+    return sys.getsizeof(arr) + arr.nbytes
+
+def _native_array(arr : numpy.ndarray) -> numpy.ndarray:
+    """
+    Returns a writable copy of arr in native byte order.
+    """
+    return arr.astype(arr.dtype.newbyteorder('='))
+
+def _digest(data) -> bytes:
+    """
+    Returns the digest used for tag fingerprints.
+    """
+    return hashlib.blake2b(data, digest_size=16).digest()
+
+def _tag_value(value):
+    """
+    Returns the value held by a value tag, or `value` itself if it is not a tag.
+    """
+    return value.value if isinstance(value, nbt_tag) else value
 
 def _write_fmt(stream, fmt, value):
     stream.write(struct.pack(fmt, value))
 
+def _parent_of(tag):
+    """
+    Returns the container that `tag` reports its changes to, or None.
+    """
+    ref = tag._parent
+    return None if ref is None else ref()
+
+def _will_change(tag, volatile : bool = False):
+    """
+    Must be called before `tag` is changed.
+    Clears the cached encoding, fingerprint and size of every container from tag
+    up to the root. Containers that lent their children to a snapshot give the
+    snapshot copies of them first, from the root down, so that the change does
+    not show up in the snapshot.
+    : volatile :    True if tag is about to hand out storage that can be changed
+                    without it knowing, so that nothing above it is cached until
+                    that is no longer the case.
+    """
+    path = []
+    node = tag if isinstance(tag, _container_tag) else _parent_of(tag)
+    while node is not None:
+        path.append(node)
+        node = _parent_of(node)
+    if volatile:
+        for node in path:
+            node._volatile = True
+    for node in reversed(path):
+        node._invalidate()
+
+def _expose(tag):
+    """
+    Called before storage of `tag` that can be changed without it knowing (a
+    writable array, or the list or dict of a container) is handed out.
+    """
+    tag._exposed = True
+    tag._volatile = True
+    tag._fingerprint = None
+    _will_change(tag, True)
+
+def _adopt(container, tag):
+    """
+    Makes `container` the parent of `tag`, which is being put into it or handed
+    out of it, and returns the tag to keep in it.
+    A tag can only report its changes to one container, so a tag that already
+    belongs to one (or to a numeric list) is replaced by a snapshot of it.
+    """
+    ref = tag._parent
+    if (ref is not None and ref() is not None) or tag._element is not None:
+        tag = tag.snapshot()
+    tag._parent = weakref.ref(container)
+    return tag
+
+def _release(container, tag):
+    # A tag that is taken out of its container no longer reports to it.
+    if _parent_of(tag) is container:
+        tag._parent = None
+
+def _lend(container):
+    """
+    Marks `container` as sharing its children with a snapshot.
+    Children that were handed out of it can outlive it, so if it goes away
+    before it stops lending them, the snapshots are given copies then.
+    """
+    if not container._lent:
+        loan = weakref.finalize(container, _repay, container._data)
+        # Nothing needs to be repaid when the interpreter exits.
+        loan.atexit = False
+        container._lent = loan
+
+def _repay(items):
+    # Replaces the children in a lent list or dict by snapshots of them.
+    for k in (items.keys() if type(items) == dict else range(len(items))):
+        items[k] = items[k].snapshot()
+
+def _owned_array(data) -> numpy.ndarray:
+    """
+    Returns `data` as an array that only the tag it is given to can write to.
+    Read-only arrays are used as they are, and anything else is copied.
+    """
+    if type(data) == numpy.ndarray and not data.flags.writeable:
+        return data
+    return numpy.array(data)
+
 class nbt_tag(ABC):
-    @abstractmethod
+    # The weakref to the container this tag reports its changes to, and whether
+    # storage of it that can be changed without notice was handed out (directly
+    # or, for _volatile, anywhere below it). These are only set on tags that are
+    # put into or handed out of a container, so loading does not pay for them.
+    # _lent holds the finalizer of a container that shares its children with a
+    # snapshot (see _lend()). _element is the numeric t_list and index that a
+    # value tag was taken out of, which keeps the value rather than the tag and
+    # is written to when the value is set.
+    _parent = None
+    _element = None
+    _exposed = False
+    _volatile = False
+    _lent = False
+    
     def write(self, stream):
-        pass
-    @abstractmethod
-    def to_bytes(self):
-        pass
+        """
+        Writes the payload of this tag (without its id and name) to a stream.
+        : stream :  Can be any value that has a function called `write` that
+                    accepts `bytes` as input.
+        """
+        write_tag_data(self, stream)
+    def to_bytes(self) -> bytes:
+        """
+        Returns the encoded payload of this tag.
+        """
+        out = bytearray()
+        _payload_encoders[type(self)](self, out)
+        return bytes(out)
     @abstractmethod
     def copy(self):
         pass
+    def _settle(self) -> bool:
+        # Returns whether storage of this tag that was handed out can still be
+        # changed without notice. Containers clear _volatile once it can not.
+        return self._exposed
+    def snapshot(self):
+        """
+        Creates a copy of this tag that can be changed without affecting this one.
+        Containers override this to share their contents until they are changed.
+        """
+        return self.copy()
+    def fingerprint(self) -> bytes:
+        """
+        Returns a 16 byte digest of this tag's type and encoded value.
+        Tags have the same fingerprint exactly when they encode to the same bytes,
+        so a compound with the same children in a different order has a different
+        fingerprint. Unlike the tags themselves, fingerprints can be used as dict keys.
+        """
+        out = bytearray((_tag_type_table[type(self)],))
+        _payload_encoders[type(self)](self, out)
+        return _digest(out)
+    @property
+    def nbytes(self) -> int:
+        """
+        An estimate of the memory held by this tag, in bytes, including the tag
+        objects, their values and any numpy buffers. Memory that is shared between
+        tags (snapshots, interned strings, arrays viewing a parsed buffer) is
+        counted once for every tag that uses it.
+        """
+        return sys.getsizeof(self) + sys.getsizeof(self.value)
+
+class _value_tag(nbt_tag):
+    """
+    Base of the tags that hold a single int, float or str in `value`.
+    """
+    __slots__ = ()
+    
+    @property
+    def value(self):
+        return self._value
+    
+    @value.setter
+    def value(self, value):
+        if self._element is not None:
+            items, index = self._element
+            items[index] = value
+        _will_change(self)
+        self._value = value
 
-class t_byte(nbt_tag):
+class t_byte(_value_tag):
     """
     Represents an 8-bit signed integer.
     Range is -128 to 127.
     """
-    __slots__ = {'value',}
-
+    __slots__ = {'_value',}
+    
     def __init__(self, value=0):
         """
         Range of value is -128 to 127.
@@ -98,9 +340,9 @@ class t_byte(nbt_tag):
         be raised.
         """
         if -128 <= value < 128:
-            self.value = value
+            self._value = value
         elif 128 <= value < 256:
-            self.value = value - 256
+            self._value = value - 256
         else:
             raise ValueError('Invalid value.')
     
@@ -110,19 +352,19 @@ class t_byte(nbt_tag):
         : stream :  Can be any value that has a function called `write` that
                     accepts `bytes` as input.
         """
-        stream.write(struct.pack('>b', self.value))
+        stream.write(struct.pack('>b', self._value))
     
     def to_bytes(self) -> bytes:
         """
         Creates a bytes objects that is a representation of this value.
         """
-        return struct.pack('>b', self.value)
+        return struct.pack('>b', self._value)
     
     def copy(self) -> nbt_tag:
         """
         Creates a copy of this tag.
         """
-        return t_byte(self.value)
+        return t_byte(self._value)
     
     def __eq__(self, other):
         if type(other) in _value_tag_types:
@@ -136,25 +378,25 @@ class t_byte(nbt_tag):
     def __repr__(self):
         return str(self.value)
 
-class t_short(nbt_tag):
-    __slots__ = {'value'}
-
+class t_short(_value_tag):
+    __slots__ = {'_value'}
+    
     def __init__(self, value=0):
         if -2**15 <= value < 2**15:
-            self.value = value
+            self._value = value
         elif 2**15 <= value < 2**16:
-            self.value = value - 2**16
+            self._value = value - 2**16
         else:
             raise ValueError('Invalid value.')
     
     def write(self, stream):
-        stream.write(struct.pack('>h', self.value))
+        stream.write(struct.pack('>h', self._value))
     
     def to_bytes(self) -> bytes:
-        return struct.pack('>h', self.value)
+        return struct.pack('>h', self._value)
     
     def copy(self) -> nbt_tag:
-        return t_short(self.value)
+        return t_short(self._value)
     
     def __eq__(self, other):
         if type(other) in _value_tag_types:
@@ -169,25 +411,25 @@ class t_short(nbt_tag):
         return str(self.value)
 
 
-class t_int(nbt_tag):
-    __slots__ = {'value'}
-
+class t_int(_value_tag):
+    __slots__ = {'_value'}
+    
     def __init__(self, value=0):
         if -2**31 <= value < 2**31:
-            self.value = value
+            self._value = value
         elif 2**31 <= value < 2**32:
-            self.value = value - 2**32
+            self._value = value - 2**32
         else:
             raise ValueError('Invalid value.')
     
     def write(self, stream):
-        stream.write(struct.pack('>i', self.value))
+        stream.write(struct.pack('>i', self._value))
     
     def to_bytes(self) -> bytes:
-        return struct.pack('>i', self.value)
+        return struct.pack('>i', self._value)
     
     def copy(self) -> nbt_tag:
-        return t_int(self.value)
+        return t_int(self._value)
     
     def __eq__(self, other):
         if type(other) in _value_tag_types:
@@ -201,25 +443,25 @@ class t_int(nbt_tag):
     def __repr__(self):
         return str(self.value)
 
-class t_long(nbt_tag):
-    __slots__ = {'value'}
-
+class t_long(_value_tag):
+    __slots__ = {'_value'}
+    
     def __init__(self, value=0):
         if -2**63 <= value < 2**63:
-            self.value = value
+            self._value = value
         elif 2**63 <= value < 2**64:
-            self.value = value - 2**64
+            self._value = value - 2**64
         else:
             raise ValueError('Invalid value.')
     
     def write(self, stream):
-        stream.write(struct.pack('>q', self.value))
+        stream.write(struct.pack('>q', self._value))
     
     def to_bytes(self) -> bytes:
-        return struct.pack('>q', self.value)
+        return struct.pack('>q', self._value)
     
     def copy(self) -> nbt_tag:
-        return t_long(self.value)
+        return t_long(self._value)
     
     def __eq__(self, other):
         if type(other) in _value_tag_types:
@@ -233,20 +475,20 @@ class t_long(nbt_tag):
     def __repr__(self):
         return str(self.value)
 
-class t_float(nbt_tag):
-    __slots__ = {'value'}
-
+class t_float(_value_tag):
+    __slots__ = {'_value'}
+    
     def __init__(self, value=0.0):
-        self.value = float(value)
+        self._value = float(value)
     
     def write(self, stream):
-        stream.write(struct.pack('>f', self.value))
+        stream.write(struct.pack('>f', self._value))
     
     def to_bytes(self) -> bytes:
-        return struct.pack('>f', self.value)
+        return struct.pack('>f', self._value)
     
     def copy(self) -> nbt_tag:
-        return t_float(self.value)
+        return t_float(self._value)
     
     def __eq__(self, other):
         if type(other) in _value_tag_types:
@@ -260,20 +502,20 @@ class t_float(nbt_tag):
     def __repr__(self):
         return str(self.value)
 
-class t_double(nbt_tag):
-    __slots__ = {'value'}
-
+class t_double(_value_tag):
+    __slots__ = {'_value'}
+    
     def __init__(self, value=0.0):
-        self.value = float(value)
+        self._value = float(value)
     
     def write(self, stream):
-        stream.write(struct.pack('>d', self.value))
+        stream.write(struct.pack('>d', self._value))
     
     def to_bytes(self) -> bytes:
-        return struct.pack('>d', self.value)
+        return struct.pack('>d', self._value)
     
     def copy(self) -> nbt_tag:
-        return t_double(self.value)
+        return t_double(self._value)
     
     def __eq__(self, other):
         if type(other) in _value_tag_types:
@@ -291,28 +533,23 @@ class t_double(nbt_tag):
     def __repr__(self):
         return str(self.value)
 
-class t_string(nbt_tag):
-    __slots__ = {'value'}
-
-    def __init__(self, value :str = ''):
-        self.value = value
+class t_string(_value_tag):
+    __slots__ = {'_value'}
     
-    def write(self, stream):
-        stream.write(struct.pack('>h', len(self.value)))
-        stream.write(self.value.encode('utf-8'))
-    
-    def to_bytes(self) -> bytes:
-        return struct.pack('>h', len(self.value)) + self.value.encode('utf-8')
+    def __init__(self, value :str = ''):
+        self._value = value
     
     def copy(self) -> nbt_tag:
-        return t_string(self.value)
+        return t_string(self._value)
     
     def __getattr__(self, attr):
+        if attr in t_string.__slots__:
+            raise AttributeError(attr)
         try:
             return getattr(self.value, attr)
         except Exception as e:
             raise e
-
+    
     def __eq__(self, other):
         if type(other) == str:
             return self.value == other
@@ -325,138 +562,255 @@ class t_string(nbt_tag):
     
     def __hash__(self):
         return hash(self.value)
-
+    
     def __str__(self):
         return self.value
     
     def __repr__(self):
         return repr(self.value)
 
-class t_bytes(nbt_tag):
-    __slots__ = {'data'}
-
-    def __init__(self, data=None):
-        if data is None:
-            numpy.array([],dtype='>i1')
-        if type(data) == list:
-            self.data = numpy.array(data, dtype='>i1')
-        elif type(data) in {bytes, bytearray}:
-            self.data = numpy.array(list(data),dtype='>i1')
-        else:
-            self.data = data
-    
-    def __getitem__(self, index):
-        if 0 <= index < len(self.data):
-            return self.data[index]
-        raise IndexError()
-    
-    def __setitem__(self, index, value):
-        self.data[index] = value
-
-    def __len__(self):
-        return len(self.data)
-    
-    def write(self, stream):
-        stream.write(struct.pack('>i', len(self.data)))
-        stream.write(self.data.tobytes())
-    
-    def to_bytes(self) -> bytes:
-        with io.BytesIO() as buffer:
-            self.write(buffer)
-            return buffer.getvalue()
-    
-    def copy(self) -> nbt_tag:
-        return t_bytes(self.data)
+class _array_tag(nbt_tag):
+    """
+    Base of t_bytes, t_ints and t_longs, which keep their elements in the numpy
+    array `data`.
+    Arrays that were decoded from a buffer or are shared with a snapshot are
+    kept read-only, and are copied the first time they are written to or `data`
+    is accessed, so that `data` can always be written to. A writable array that
+    is passed in is copied, so that only the tag can write to its array without
+    it knowing.
+    """
+    __slots__ = {'_data', '_fingerprint'}
+    _dtype = None
     
-    def __eq__(self, other):
-        if type(other) == t_bytes:
-            return numpy.array_equal(self.data, other.data)
-        else:
-            return numpy.array_equal(self.data, other)
-
-class t_ints(nbt_tag):
-    __slots__ = {'data'}
-
     def __init__(self, data=None):
+        self._data = self._array(data)
+        self._fingerprint = None
+    
+    def _array(self, data) -> numpy.ndarray:
         if data is None:
-            numpy.array([],dtype='>i4')
+            return numpy.array([], dtype=self._dtype)
         if type(data) == list:
-            self.data = numpy.array(data, dtype='>i4')
-        else:
-            self.data = data
+            return numpy.array(data, dtype=self._dtype)
+        if type(data) in {bytes, bytearray, memoryview}:
+            data = numpy.frombuffer(data, dtype=self._dtype)
+        data = numpy.asarray(data)
+        dtype = data.dtype
+        if dtype.kind not in 'biu':
+            raise TypeError(f'Can not store an array of {dtype} in {type(self).__name__}.')
+        width = numpy.dtype(self._dtype).itemsize
+        if dtype.kind == 'u' and dtype.itemsize == width:
+            # Unsigned data of the same width (such as packed nibbles) keeps its bits.
+            data = data.view(dtype.str.replace('u', 'i'))
+        elif dtype.kind != 'i' or dtype.itemsize != width:
+            converted = data.astype(f'i{width}')
+            if not numpy.array_equal(converted, data):
+                raise OverflowError(f'The values do not fit in {type(self).__name__}.')
+            data = converted
+        return _owned_array(data)
+    
+    @property
+    def data(self) -> numpy.ndarray:
+        # The array that is handed out can be written to without this tag knowing,
+        # so the containers above it stop caching. A read-only array is copied
+        # first, as in t_list.data.
+        if not self._data.flags.writeable:
+            self._data = self._data.copy()
+        if not self._exposed:
+            _expose(self)
+        return self._data
+    
+    @data.setter
+    def data(self, value):
+        _will_change(self)
+        self._data = self._array(value)
+        self._fingerprint = None
+        self._exposed = False
+        self._volatile = False
     
     def __getitem__(self, index):
-        if 0 <= index < len(self.data):
-            return self.data[index]
+        if 0 <= index < len(self._data):
+            return self._data[index]
         raise IndexError()
     
     def __setitem__(self, index, value):
-        self.data[index] = value
-
+        _will_change(self)
+        if not self._data.flags.writeable:
+            self._data = _native_array(self._data)
+        self._data[index] = value
+        self._fingerprint = None
+    
+    @property
+    def native(self) -> numpy.ndarray:
+        """
+        `data` as a writable native-endian array.
+        The first access replaces `data` with a native-endian copy, so numeric code
+        that uses it does not have to swap bytes on every operation. It is only
+        converted back to big-endian when it is written.
+        """
+        if not (self._data.dtype.isnative and self._data.flags.writeable):
+            self._data = _native_array(self._data)
+            self._fingerprint = None
+        if not self._exposed:
+            _expose(self)
+        return self._data
+    
     def __len__(self):
-        return len(self.data)
+        return len(self._data)
     
     def __eq__(self, other):
-        if type(other) == t_ints:
-            return numpy.array_equal(self.data, other.data)
+        if type(other) == type(self):
+            return numpy.array_equal(self._data, other._data)
         else:
-            return numpy.array_equal(self.data, other)
-    
-    def write(self, stream):
-        stream.write(struct.pack('>i', len(self.data)))
-        stream.write(self.data.tobytes())
-    
-    def to_bytes(self) -> bytes:
-        with io.BytesIO() as buffer:
-            self.write(buffer)
-            return buffer.getvalue()
+            return numpy.array_equal(self._data, other)
     
     def copy(self) -> nbt_tag:
-        return t_ints(self.data)
+        return type(self)(self._data)
+    
+    def fingerprint(self) -> bytes:
+        # Kept until the array is changed, unless it was handed out and can be
+        # written to without this tag knowing.
+        if self._fingerprint is not None:
+            return self._fingerprint
+        fingerprint = nbt_tag.fingerprint(self)
+        if not self._exposed:
+            self._fingerprint = fingerprint
+        return fingerprint
+    
+    @property
+    def nbytes(self) -> int:
+        return sys.getsizeof(self) + _array_nbytes(self._data)
+    
+    def snapshot(self) -> nbt_tag:
+        # Both tags share a read-only array and copy it on their next write. An
+        # array that was handed out may still be written to, so the snapshot gets
+        # a copy of it instead.
+        if not self._exposed:
+            self._data.flags.writeable = False
+        clone = type(self)(self._data)
+        clone._fingerprint = self._fingerprint
+        return clone
 
-class t_longs(nbt_tag):
-    __slots__ = {'data'}
+class t_bytes(_array_tag):
+    __slots__ = ()
+    _dtype = '>i1'
 
-    def __init__(self, data=None):
-        if data is None:
-            data = numpy.array([], dtype='>i8')
-        if type(data) == list:
-            self.data = numpy.array(data, dtype='>i8')
-        else:
-            self.data = data
-    
-    def __getitem__(self, index):
-        if 0 <= index < len(self.data):
-            return self.data[index]
-        raise IndexError()
-    
-    def __setitem__(self, index, value):
-        self.data[index] = value
-
-    def __len__(self):
-        return len(self.data)
-    
-    def __eq__(self, other):
-        if type(other) == t_longs:
-            return numpy.array_equal(self.data, other.data)
-        else:
-            return numpy.array_equal(self.data, other)
-    
-    def write(self, stream):
-        stream.write(struct.pack('>i', len(self.data)))
-        stream.write(self.data.tobytes())
-    
-    def to_bytes(self) -> bytes:
-        with io.BytesIO() as buffer:
-            self.write(buffer)
-            return buffer.getvalue()
+class t_ints(_array_tag):
+    __slots__ = ()
+    _dtype = '>i4'
 
-    def copy(self) -> nbt_tag:
-        return t_longs(self.data)
+class t_longs(_array_tag):
+    __slots__ = ()
+    _dtype = '>i8'
 
-class t_list(nbt_tag):
-    __slots__ = {'data', 'type'}
+class _container_tag(nbt_tag):
+    """
+    Base of t_list and t_compound.
+    Containers cache their encoded bytes (`_source`), their fingerprint and their
+    nbytes. A tag learns which container it is in when it is put into it or
+    handed out of it, and reports to it before it is changed, which clears those
+    caches on the way up to the root, so every subtree that did not change keeps
+    its own.
+    Snapshots share the children of a container until either side changes. The
+    container that was snapshotted is marked as having lent its children, and
+    before anything below it changes it gives the snapshot copies, so it keeps
+    the very tags that were handed out of it, before or after the snapshot.
+    """
+    __slots__ = {'_data', '_shared', '_source', '_fingerprint', '_nbytes'}
+    
+    @property
+    def is_dirty(self) -> bool:
+        """
+        False if this is known to be unchanged since it was parsed or last
+        encoded, in which case it is written by copying those bytes.
+        """
+        return self._source is None
+    
+    def _invalidate(self):
+        # Called on every container from a tag that is about to change up to the root.
+        if self._lent:
+            self._unlend()
+        elif self._shared:
+            self._own()
+        self._source = None
+        self._fingerprint = None
+        self._nbytes = None
+    
+    def _edit(self, volatile : bool = False):
+        """
+        Prepares this container for a change to its own children and returns them.
+        : volatile :    True if a volatile tag is being put into it.
+        """
+        _will_change(self, volatile)
+        return self._data
+    
+    def _settle(self) -> bool:
+        # _volatile is only cleared once nothing that was handed out is left below.
+        self._volatile = self._exposed or any(v._settle() for v in self._children() if v._volatile)
+        return self._volatile
+    
+    def fingerprint(self) -> bytes:
+        # The fingerprint is the digest of the encoding, which gives every
+        # container in this one its span of it, so after a change only the path
+        # down to the change is encoded again. It is kept until something below
+        # changes, unless storage below was handed out and can change without notice.
+        if self._fingerprint is not None:
+            return self._fingerprint
+        prefix = _tag_id_bytes[_tag_type_table[type(self)]]
+        if self._volatile and self._settle():
+            return _digest(prefix + _cache_source(self))
+        if self._source is None:
+            _cache_source(self)
+        self._fingerprint = _digest(prefix + self._source)
+        return self._fingerprint
+    
+    @property
+    def nbytes(self) -> int:
+        # Kept like the fingerprint, so after a change only the containers on the
+        # path down to it are measured again.
+        if self._nbytes is None:
+            size = self._measure()
+            if not self._sized():
+                return size
+            self._nbytes = size
+        return self._nbytes
+    
+    def _sized(self) -> bool:
+        # Whether the size of this container can only change through a change
+        # below it. That is not the case while storage below was handed out, or
+        # below a snapshot that still shares its children (it copies them when one
+        # is handed out) or a t_lazy_compound (it grows as its children are
+        # decoded). Those never keep their nbytes, so it is enough to check the
+        # children.
+        if self._shared or (self._volatile and self._settle()):
+            return False
+        return all(v._nbytes is not None for v in self._children() if type(v) in _container_tag_types)
+    
+    def _hand_out(self, key):
+        # The child is adopted when it is handed out, so that it reports its
+        # changes to this container.
+        if self._shared:
+            self._own()
+        items = self._data
+        tag = items[key]
+        ref = tag._parent
+        if ref is None or ref() is not self:
+            tag = items[key] = _adopt(self, tag)
+        return tag
 
+class t_list(_container_tag):
+    """
+    A list of tags that all have the same type.
+    Lists of numeric tags (t_byte, t_short, t_int, t_long, t_float and t_double)
+    keep their values in `data` as a native-endian numpy array rather than as a
+    list of tags, so that they can be used for vectorized math. Indexing such a
+    list returns a new tag holding the value, which writes changes to its
+    value back to that index of the list. The list methods (index, count, remove, reverse, append,
+    pop, ...) work the same for both kinds, but `data` itself is the numpy
+    array, so iterating it yields numpy scalars rather than tags.
+    Lists of any other type keep a list of tags in `data`.
+    """
+    __slots__ = {'type'}
+    
     def __init__(self, tag_type, data=None):
         if type(tag_type) == int:
             self.type = tag_type
@@ -466,134 +820,578 @@ class t_list(nbt_tag):
             self.type = _tag_type_table[tag_type]
         else:
             self.type = 0
-        if type(data) == list:
-            self.data = list(data)
+        self._shared = False
+        self._source = None
+        self._fingerprint = None
+        self._nbytes = None
+        self._set_items(data)
+    
+    def _set_items(self, data):
+        dtype = _list_value_dtypes[self.type]
+        if dtype is not None:
+            if data is None:
+                self._data = numpy.zeros(0, dtype=dtype)
+            elif type(data) == numpy.ndarray:
+                # Writable arrays are copied, so that they can only be changed through this list.
+                self._data = data.astype(dtype, copy=data.flags.writeable)
+            else:
+                self._data = numpy.array([_tag_value(v) for v in data], dtype=dtype)
+        elif type(data) == list:
+            self._data = [_adopt(self, v) for v in data]
+            if any(v._volatile for v in self._data):
+                self._volatile = True
         else:
-            self.data = list()
+            self._data = list()
+    
+    @property
+    def data(self):
+        # Whatever is handed out may be changed without this list knowing. A
+        # read-only array (shared with a snapshot) is copied first, so that it can
+        # be written to.
+        if type(self._data) == numpy.ndarray and not self._data.flags.writeable:
+            self._data = self._data.copy()
+        if not self._exposed:
+            _expose(self)
+        return self._data
+    
+    @data.setter
+    def data(self, value):
+        _will_change(self)
+        self._exposed = False
+        self._set_items(value)
+        if self._volatile:
+            _will_change(self, True)
+    
+    @property
+    def is_numeric(self) -> bool:
+        """
+        True if `data` is a numpy array rather than a list of tags.
+        """
+        return type(self._data) == numpy.ndarray
+    
+    def _wrap(self, index):
+        # Returns a tag holding an element of a numeric list that writes changes
+        # to its value back to the list.
+        tag = _tag_type_table[self.type](self._data[index].item())
+        tag._element = (self, index)
+        return tag
+    
+    def _values(self, values) -> numpy.ndarray:
+        # Converts values to the dtype of a numeric list, so that values out of
+        # its range raise OverflowError the same way as in __setitem__.
+        return numpy.array([_tag_value(v) for v in values], dtype=self._data.dtype)
+    
+    def _edit_array(self) -> numpy.ndarray:
+        # Prepares a numeric list for a change and returns its array.
+        _will_change(self)
+        if not self._data.flags.writeable:
+            self._data = self._data.copy()
+        return self._data
     
     def __getitem__(self, index):
-        if 0 <= index < len(self.data):
-            return self.data[index]
+        if 0 <= index < len(self._data):
+            if type(self._data) == numpy.ndarray:
+                return self._wrap(index)
+            return self._hand_out(index)
         raise IndexError()
     
+    def __setitem__(self, index, value):
+        if type(self._data) == numpy.ndarray:
+            self._edit_array()[index] = _tag_value(value)
+            return
+        items = self._edit(value._volatile)
+        _release(self, items[index])
+        items[index] = _adopt(self, value)
+    
+    def __delitem__(self, index):
+        if type(self._data) == numpy.ndarray:
+            _will_change(self)
+            self._data = numpy.delete(self._data, index)
+            return
+        items = self._edit()
+        removed = items[index]
+        for v in (removed if type(index) == slice else (removed,)):
+            _release(self, v)
+        del items[index]
+    
+    def __iter__(self):
+        if type(self._data) == numpy.ndarray:
+            return map(self._wrap, range(len(self._data)))
+        for i in range(len(self._data)):
+            self._hand_out(i)
+        return iter(self._data)
+    
     def __len__(self):
-        return len(self.data)
+        return len(self._data)
+    
+    def append(self, value):
+        if type(self._data) == numpy.ndarray:
+            values = self._values((value,))
+            _will_change(self)
+            self._data = numpy.concatenate((self._data, values))
+        else:
+            self._edit(value._volatile).append(_adopt(self, value))
+    
+    def extend(self, values):
+        if type(self._data) == numpy.ndarray:
+            values = self._values(values)
+            _will_change(self)
+            self._data = numpy.concatenate((self._data, values))
+        else:
+            values = list(values)
+            items = self._edit(any(v._volatile for v in values))
+            items.extend(_adopt(self, v) for v in values)
+    
+    def insert(self, index, value):
+        if type(self._data) == numpy.ndarray:
+            values = self._values((value,))
+            _will_change(self)
+            self._data = numpy.insert(self._data, index, values)
+        else:
+            self._edit(value._volatile).insert(index, _adopt(self, value))
+    
+    def pop(self, index=-1):
+        if type(self._data) == numpy.ndarray:
+            value = _tag_type_table[self.type](self._data[index].item())
+            _will_change(self)
+            self._data = numpy.delete(self._data, index)
+            return value
+        value = self._edit().pop(index)
+        _release(self, value)
+        return value
+    
+    def _matches(self, value) -> numpy.ndarray:
+        # Compares the elements of a numeric list to value. Floats are compared in
+        # the dtype of the list, so that they match the values they are stored as.
+        value = _tag_value(value)
+        if self._data.dtype.kind == 'f':
+            value = self._data.dtype.type(value)
+        return self._data == value
+    
+    def index(self, value, start=0, stop=sys.maxsize) -> int:
+        if type(self._data) != numpy.ndarray:
+            return self._data.index(value, start, stop)
+        start, stop, _ = slice(start, stop).indices(len(self._data))
+        found = numpy.flatnonzero(self._matches(value)[start:stop])
+        if len(found) == 0:
+            raise ValueError(f'{value!r} is not in list')
+        return start + int(found[0])
+    
+    def count(self, value) -> int:
+        if type(self._data) != numpy.ndarray:
+            return self._data.count(value)
+        return int(numpy.count_nonzero(self._matches(value)))
+    
+    def remove(self, value):
+        del self[self.index(value)]
+    
+    def reverse(self):
+        if type(self._data) == numpy.ndarray:
+            _will_change(self)
+            self._data = self._data[::-1].copy()
+        else:
+            self._edit().reverse()
+    
+    def clear(self):
+        items = self._edit()
+        if type(items) == numpy.ndarray:
+            self._data = items[:0].copy()
+        else:
+            for v in items:
+                _release(self, v)
+            self._data = list()
+        self._exposed = False
     
     def __getattr__(self, attr):
+        if attr in t_list.__slots__ or attr in _container_tag.__slots__:
+            raise AttributeError(attr)
         try:
             return getattr(self.data, attr)
         except AttributeError as e:
             raise e
-
+    
     def __eq__(self, other):
         if type(other) == t_list:
-            return self.data == other.data
+            if type(self._data) == numpy.ndarray and type(other._data) == numpy.ndarray:
+                return numpy.array_equal(self._data, other._data)
+            return list(self._iter_values()) == list(other._iter_values())
         if type(other) == list:
-            return self.data == other
+            return list(self._iter_values()) == other
         return False
     
-    def write(self, stream):
-        _write_fmt(stream, '>B', self.type)
-        _write_fmt(stream, '>i', len(self.data))
-        for v in self.data:
-            v.write(stream)
-    
-    def to_bytes(self) -> bytes:
-        with io.BytesIO() as buffer:
-            self.write(buffer)
-            return buffer.getvalue()
+    def _iter_values(self):
+        # Iterates without taking ownership of a shared list.
+        if type(self._data) == numpy.ndarray:
+            return map(_tag_type_table[self.type], self._data.tolist())
+        return iter(self._data)
     
     def copy(self) -> nbt_tag:
-        return t_list(self.type, self.data)
-
-class t_compound(nbt_tag):
-    __slots__ = {'data'}
-    data : dict
+        """
+        Creates a copy of this list. See snapshot().
+        """
+        return self.snapshot()
+    
+    def snapshot(self) -> nbt_tag:
+        """
+        Creates a copy-on-write copy of this list.
+        The copy shares its elements (or its numpy array) with this list until
+        either side is changed, and then only the part that is changed is copied.
+        Changes made through tags that were taken out of this list, before or
+        after the snapshot, only show up in this list.
+        """
+        clone = t_list.__new__(t_list)
+        clone.type = self.type
+        clone._source = self._source
+        clone._fingerprint = self._fingerprint
+        # The size is not shared, since the snapshot copies its children once
+        # one of them is handed out.
+        clone._nbytes = None
+        clone._shared = False
+        items = self._data
+        if type(items) == numpy.ndarray:
+            if self._exposed:
+                # The array was handed out and may still be written to.
+                clone._data = items.copy()
+            else:
+                items.flags.writeable = False
+                clone._data = items
+        elif self._volatile:
+            # Something below was handed out and may be changed without notice,
+            # so the snapshot gets its copies now.
+            clone._data = [v.snapshot() for v in items]
+        else:
+            clone._data = items
+            clone._shared = True
+            if not self._shared:
+                _lend(self)
+        return clone
+    
+    def _own(self):
+        # Replaces the items shared with other snapshots by snapshots of them.
+        self._data = [v.snapshot() for v in self._data]
+        self._shared = False
+    
+    def _unlend(self):
+        # This list keeps its items and the snapshots that share them get copies.
+        lent = self._data
+        self._lent.detach()
+        self._lent = False
+        self._data = list(lent)
+        _repay(lent)
+    
+    def _children(self):
+        items = self._data
+        return () if type(items) == numpy.ndarray else items
+    
+    def _measure(self) -> int:
+        if type(self._data) == numpy.ndarray:
+            return sys.getsizeof(self) + _array_nbytes(self._data)
+        return sys.getsizeof(self) + sys.getsizeof(self._data) + sum(v.nbytes for v in self._data)
 
+class t_compound(_container_tag):
+    __slots__ = ()
+    
     def __init__(self, data : dict = None):
         """
         data must be a dict where the keys are of type str, and the values are of type nbt_tag.
         """
         if data is None:
             data = {}
-        self.data = dict(data)
+        self._shared = False
+        self._source = None
+        self._fingerprint = None
+        self._nbytes = None
+        self._set_items(data)
+    
+    def _set_items(self, data : dict):
+        self._data = {k : _adopt(self, v) for k, v in data.items()}
+        if any(v._volatile for v in self._data.values()):
+            self._volatile = True
+    
+    @property
+    def data(self) -> dict:
+        # The dict is handed out as it is, so from now on it may be changed
+        # without this compound knowing.
+        if not self._exposed:
+            _expose(self)
+        return self._data
+    
+    @data.setter
+    def data(self, value : dict):
+        _will_change(self)
+        self._exposed = False
+        self._set_items(value)
+        if self._volatile:
+            _will_change(self, True)
+    
+    def _view(self) -> dict:
+        """
+        Returns the dict of children for reading only, without taking ownership of
+        it if it is shared with a snapshot.
+        """
+        return self._data
     
     def __getitem__(self, id):
-        if id in self.data:
-            return self.data[id]
+        if id in self._data:
+            return self._hand_out(id)
         raise KeyError()
     
     def get(self, id, default=None):
-        return self.data.get(id, default)
+        if id in self._data:
+            return self._hand_out(id)
+        return default
     
     def __setitem__(self, id, value):
-        if issubclass(type(value), nbt_tag):
-            self.data[id] = value
-        else:
+        if not issubclass(type(value), nbt_tag):
             if type(value) == int:
-                self.data[id] = t_int(value)
-                return
-            if type(value) == float:
-                self.data[id] = t_float(value)
-                return
-            if type(value) == str:
-                self.data[id] = t_string(value)
+                value = t_int(value)
+            elif type(value) == float:
+                value = t_float(value)
+            elif type(value) == str:
+                value = t_string(value)
+            elif type(value) == bool:
+                value = t_byte(1 if value else 0)
+            elif type(value) in {numpy.int8, numpy.uint8}:
+                value = t_byte(value)
+            else:
                 return
-            if type(value) == bool:
-                self.data[id] = t_byte(1 if value else 0)
-            if type(value) in {numpy.int8, numpy.uint8}:
-                self.data[id] == t_byte(value)
+        items = self._edit(value._volatile)
+        old = items.get(id, None)
+        if old is not None:
+            _release(self, old)
+        items[id] = _adopt(self, value)
     
     def __delitem__(self, id):
-        del self.data[id]
-
+        _release(self, self._edit().pop(id))
+    
     def __contains__(self, id):
-        return id in self.data
+        return id in self._data
     
     def __getattr__(self, id):
-        return self.data.get(id, None)
+        if id in _container_tag.__slots__:
+            raise AttributeError(id)
+        return self.get(id, None)
     
     def __len__(self):
-        return len(self.data)
+        return len(self._data)
     
     def __eq__(self, other):
-        if type(other) == t_compound and len(self.data) == len(other.data):
-            for k, v in self.data.items():
-                if k not in other.data or other.data[k] != v:
-                    return False
-            return True
-        if type(other) == dict and len(self.data) == len(other):
-            for k, v in self.data.items():
+        if isinstance(other, t_compound):
+            other = other._view()
+        elif type(other) != dict:
+            return False
+        items = self._view()
+        if len(items) == len(other):
+            for k, v in items.items():
                 if k not in other or other[k] != v:
                     return False
             return True
         return False
     
     def keys(self) -> typing.KeysView:
-        return self.data.keys()
+        return self._data.keys()
+    
+    def _hand_out_all(self) -> dict:
+        for k in self._view():
+            self._hand_out(k)
+        return self._data
     
     def values(self) -> typing.ValuesView:
-        return self.data.values()
+        return self._hand_out_all().values()
     
     def items(self) -> typing.ItemsView:
-        return self.data.items()
+        return self._hand_out_all().items()
     
-    def write(self, stream):
-        for k, v in self.data.items():
-            tag_type = _tag_type_table[type(v)]
-            stream.write(struct.pack('>B', tag_type))
-            stream.write(struct.pack('>H', len(k)))
-            stream.write(k.encode('utf-8'))
-            v.write(stream)
-        stream.write(_byte_format.pack(0))
+    def copy(self):
+        """
+        Creates a copy of this compound. See snapshot().
+        """
+        return self.snapshot()
     
-    def to_bytes(self) -> bytes:
-        with io.BytesIO() as buffer:
-            self.write(buffer)
-            return buffer.getvalue()
+    def snapshot(self) -> nbt_tag:
+        """
+        Creates a copy-on-write copy of this compound.
+        The copy shares its children with this compound until either side is
+        changed, and then only that compound's own children are copied
+        (compounds and lists as further snapshots), so a change deep in the tree
+        only copies the path leading to it.
+        Changes made through tags that were taken out of this compound, before
+        or after the snapshot, only show up in this compound.
+        """
+        items = self._view()
+        clone = t_compound.__new__(type(self))
+        clone._source = self._source
+        clone._fingerprint = self._fingerprint
+        # The size is not shared, since the snapshot copies its children once
+        # one of them is handed out.
+        clone._nbytes = None
+        if self._volatile:
+            # Something below was handed out and may be changed without notice,
+            # so the snapshot gets its copies now.
+            clone._data = {k : v.snapshot() for k, v in items.items()}
+            clone._shared = False
+        else:
+            clone._data = items
+            clone._shared = True
+            if not self._shared:
+                _lend(self)
+        return clone
+    
+    def _own(self):
+        # Replaces the children shared with other snapshots by snapshots of them.
+        self._data = {k : v.snapshot() for k, v in self._data.items()}
+        self._shared = False
+    
+    def _unlend(self):
+        # This compound keeps its children and the snapshots that share them get copies.
+        lent = self._data
+        self._lent.detach()
+        self._lent = False
+        self._data = dict(lent)
+        _repay(lent)
+    
+    def _children(self):
+        return self._data.values()
+    
+    def _measure(self) -> int:
+        items = self._data
+        size = sys.getsizeof(self) + sys.getsizeof(items)
+        for k, v in items.items():
+            size += sys.getsizeof(k) + v.nbytes
+        return size
+
+class t_lazy_compound(t_compound):
+    """
+    A t_compound that has only indexed where its children are in the source
+    buffer. A child is decoded the first time it is accessed through
+    __getitem__, __getattr__ or get.
+    Anything that needs the full dict (`data`, items(), values(), mutation,
+    comparison) decodes the remaining children first, after which this
+    behaves exactly like a t_compound.
+    """
+    __slots__ = {'_buffer', '_index'}
     
-    def copy(self):
-        return t_compound(self.data)
+    def __init__(self, buffer, index : dict):
+        """
+        : buffer :  The bytes-like object that the children are stored in.
+        : index :   A dict of name -> (tag_id, start, end), where start and end
+                    are the offsets of the child's payload in buffer.
+        """
+        self._data = {}
+        self._shared = False
+        self._source = None
+        self._fingerprint = None
+        self._nbytes = None
+        self._buffer = buffer
+        self._index = index
+    
+    def _decode(self, id):
+        tag = self._data.get(id, None)
+        if tag is None:
+            tag_id, start, _ = self._index[id]
+            tag, _ = _lazy_payload_loaders[tag_id](self._buffer, start)
+            self._data[id] = tag
+        return tag
+    
+    def _load(self):
+        if self._index is not None:
+            self._data = {id : self._decode(id) for id in self._index}
+            self._buffer = None
+            self._index = None
+    
+    @property
+    def data(self) -> dict:
+        self._load()
+        return t_compound.data.fget(self)
+    
+    @data.setter
+    def data(self, value : dict):
+        self._buffer = None
+        self._index = None
+        t_compound.data.fset(self, value)
+    
+    def _view(self) -> dict:
+        self._load()
+        return self._data
+    
+    def _edit(self, volatile : bool = False):
+        self._load()
+        return t_compound._edit(self, volatile)
+    
+    @property
+    def is_loaded(self) -> bool:
+        """
+        True once every child has been decoded.
+        """
+        return self._index is None
+    
+    def __getitem__(self, id):
+        if self._index is None:
+            return t_compound.__getitem__(self, id)
+        if id in self._index:
+            self._decode(id)
+            return self._hand_out(id)
+        raise KeyError()
+    
+    def get(self, id, default=None):
+        if self._index is None:
+            return t_compound.get(self, id, default)
+        if id in self._index:
+            self._decode(id)
+            return self._hand_out(id)
+        return default
+    
+    def __getattr__(self, id):
+        if id in t_lazy_compound.__slots__ or id in _container_tag.__slots__:
+            raise AttributeError(id)
+        return self.get(id, None)
+    
+    def __contains__(self, id):
+        if self._index is None:
+            return t_compound.__contains__(self, id)
+        return id in self._index
+    
+    def __len__(self):
+        if self._index is None:
+            return t_compound.__len__(self)
+        return len(self._index)
+    
+    def keys(self) -> typing.KeysView:
+        if self._index is None:
+            return t_compound.keys(self)
+        return self._index.keys()
+    
+    def snapshot(self) -> nbt_tag:
+        if self._index is None:
+            # Loaded compounds stay t_lazy_compound, so that the snapshots that
+            # are given in place of their children have the same size.
+            clone = t_compound.snapshot(self)
+            clone._buffer = None
+            clone._index = None
+            return clone
+        # Undecoded children are immutable bytes, so only the decoded ones need
+        # to be snapshotted.
+        clone = t_lazy_compound(self._buffer, self._index)
+        clone._data = {k : v.snapshot() for k, v in self._data.items()}
+        clone._source = self._source
+        clone._fingerprint = self._fingerprint
+        return clone
+    
+    def _sized(self) -> bool:
+        return self._index is None and t_compound._sized(self)
+    
+    def _measure(self) -> int:
+        if self._index is None:
+            return t_compound._measure(self)
+        # Children that were not decoded yet only take up the index entry that
+        # points to their bytes in the buffer.
+        index = self._index
+        items = self._data
+        size = t_compound._measure(self) + sys.getsizeof(index)
+        for k, entry in index.items():
+            if k not in items:
+                size += sys.getsizeof(k) + sys.getsizeof(entry) + entry[2] - entry[1]
+        return size
 
 def read_tag_data(stream, id):
     if id == 1:
@@ -610,79 +1408,502 @@ def read_tag_data(stream, id):
         return t_double(_read_double(stream))
     if id == 7:
         size = _read_int(stream)
-        return t_bytes(stream.read(size))
+        return t_bytes(_read_array(stream, _byte_array_dtype, size))
     if id == 8:
         size = _read_ushort(stream)
-        return t_string(stream.read(size).decode('utf-8'))
+        return t_string(_decode_string(stream.read(size)))
     if id == 9:
         tagid = _read_byte(stream)
         size = _read_int(stream)
+        dtype = _list_array_dtypes[tagid]
+        if dtype is not None:
+            return t_list(tagid, _read_array(stream, dtype, max(size, 0)))
         items = [read_tag_data(stream, tagid) for _ in range(size)]
-        return t_list(tagid, items)
+        return _loaded_list(tagid, items)
     if id == 10:
         items = dict()
         while tagid := _read_byte(stream):
             tag_name = _read_string(stream)
             tag = read_tag_data(stream, tagid)
             items[tag_name] = tag
-        return t_compound(items)
+        return _loaded_compound(items)
     if id == 11:
         size = _read_int(stream)
-        items = [_read_int(stream) for _ in range(size)]
-        return t_ints(items)
+        return t_ints(_read_array(stream, _int_array_dtype, size))
     if id == 12:
         size = _read_int(stream)
-        items = [_read_long(stream) for _ in range(size)]
-        return t_longs(items)
+        return t_longs(_read_array(stream, _long_array_dtype, size))
 
-def write_tag_data(tag : nbt_tag, stream):
-    if type(tag) in _value_tag_types:
-        stream.write(_value_tag_format[type(tag)].pack(tag.value))
+def _loaded_compound(items : dict) -> t_compound:
+    # Children that were just loaded can only be reached through the compound,
+    # so they are adopted when they are handed out rather than here.
+    tag = t_compound.__new__(t_compound)
+    tag._data = items
+    tag._shared = False
+    tag._source = None
+    tag._fingerprint = None
+    tag._nbytes = None
+    return tag
+
+def _loaded_list(tag_id : int, items : list) -> t_list:
+    # See _loaded_compound. Empty lists go through t_list, which picks the
+    # container (list or numpy array) for the type.
+    if not items:
+        return t_list(tag_id)
+    tag = t_list.__new__(t_list)
+    tag.type = tag_id
+    tag._data = items
+    tag._shared = False
+    tag._source = None
+    tag._fingerprint = None
+    tag._nbytes = None
+    return tag
+
+# The _load_* functions decode a tag payload directly from a bytes-like
+# object, starting at `offset`. Each returns a tuple of (tag, end_offset).
+# They are dispatched by tag id through _payload_loaders.
+
+def _load_byte(buffer, offset):
+    return t_byte(_sbyte_format.unpack_from(buffer, offset)[0]), offset + 1
+
+def _load_short(buffer, offset):
+    return t_short(_short_format.unpack_from(buffer, offset)[0]), offset + 2
+
+def _load_int(buffer, offset):
+    return t_int(_int_format.unpack_from(buffer, offset)[0]), offset + 4
+
+def _load_long(buffer, offset):
+    return t_long(_long_format.unpack_from(buffer, offset)[0]), offset + 8
+
+def _load_float(buffer, offset):
+    return t_float(_float_format.unpack_from(buffer, offset)[0]), offset + 4
+
+def _load_double(buffer, offset):
+    return t_double(_double_format.unpack_from(buffer, offset)[0]), offset + 8
+
+def _load_byte_array(buffer, offset):
+    size = _int_format.unpack_from(buffer, offset)[0]
+    offset += 4
+    data = numpy.frombuffer(buffer, _byte_array_dtype, size, offset)
+    return t_bytes(data), offset + size
+
+def _load_string(buffer, offset):
+    size = _ushort_format.unpack_from(buffer, offset)[0]
+    offset += 2
+    return t_string(_decode_string(buffer[offset:offset + size])), offset + size
+
+def _load_list(buffer, offset):
+    start = offset
+    tag_id, size = _list_header_format.unpack_from(buffer, offset)
+    offset += 5
+    dtype = _list_array_dtypes[tag_id]
+    if dtype is not None and size > 0:
+        offset += size * dtype.itemsize
+        tag = t_list(tag_id, numpy.frombuffer(buffer, dtype, size, start + 5))
+    else:
+        loader = _payload_loaders[tag_id]
+        items = []
+        for _ in range(size):
+            item, offset = loader(buffer, offset)
+            items.append(item)
+        tag = _loaded_list(tag_id, items)
+    tag._source = buffer[start:offset]
+    return tag, offset
+
+def _load_compound(buffer, offset):
+    start = offset
+    loaders = _payload_loaders
+    items = {}
+    while tag_id := buffer[offset]:
+        size = _ushort_format.unpack_from(buffer, offset + 1)[0]
+        offset += 3
+        name = _decode_string(buffer[offset:offset + size])
+        items[name], offset = loaders[tag_id](buffer, offset + size)
+    offset += 1
+    tag = _loaded_compound(items)
+    tag._source = buffer[start:offset]
+    return tag, offset
+
+def _load_int_array(buffer, offset):
+    size = _int_format.unpack_from(buffer, offset)[0]
+    offset += 4
+    data = numpy.frombuffer(buffer, _int_array_dtype, size, offset)
+    return t_ints(data), offset + size * 4
+
+def _load_long_array(buffer, offset):
+    size = _int_format.unpack_from(buffer, offset)[0]
+    offset += 4
+    data = numpy.frombuffer(buffer, _long_array_dtype, size, offset)
+    return t_longs(data), offset + size * 8
+
+def _load_lazy_list(buffer, offset):
+    start = offset
+    tag_id, size = _list_header_format.unpack_from(buffer, offset)
+    offset += 5
+    dtype = _list_array_dtypes[tag_id]
+    if dtype is not None and size > 0:
+        offset += size * dtype.itemsize
+        tag = t_list(tag_id, numpy.frombuffer(buffer, dtype, size, start + 5))
+    else:
+        loader = _lazy_payload_loaders[tag_id]
+        items = []
+        for _ in range(size):
+            item, offset = loader(buffer, offset)
+            items.append(item)
+        tag = _loaded_list(tag_id, items)
+    tag._source = buffer[start:offset]
+    return tag, offset
+
+def _load_lazy_compound(buffer, offset):
+    start = offset
+    skippers = _payload_skippers
+    index = {}
+    while tag_id := buffer[offset]:
+        size = _ushort_format.unpack_from(buffer, offset + 1)[0]
+        offset += 3
+        name = _decode_string(buffer[offset:offset + size])
+        child_start = offset + size
+        offset = skippers[tag_id](buffer, child_start)
+        index[name] = (tag_id, child_start, offset)
+    offset += 1
+    tag = t_lazy_compound(buffer, index)
+    tag._source = buffer[start:offset]
+    return tag, offset
+
+# The _skip_* functions return the offset just past the payload that starts
+# at `offset`, without decoding it. They are dispatched through _payload_skippers.
+
+def _skip_fixed(width, buffer, offset):
+    return offset + width
+
+def _skip_byte_array(buffer, offset):
+    return offset + 4 + _int_format.unpack_from(buffer, offset)[0]
+
+def _skip_string(buffer, offset):
+    return offset + 2 + _ushort_format.unpack_from(buffer, offset)[0]
+
+def _skip_list(buffer, offset):
+    tag_id, size = _list_header_format.unpack_from(buffer, offset)
+    offset += 5
+    if size <= 0:
+        return offset
+    width = _payload_widths[tag_id]
+    if width:
+        return offset + width * size
+    skip = _payload_skippers[tag_id]
+    for _ in range(size):
+        offset = skip(buffer, offset)
+    return offset
+
+def _skip_compound(buffer, offset):
+    skippers = _payload_skippers
+    widths = _payload_widths
+    unpack_name = _ushort_format.unpack_from
+    while tag_id := buffer[offset]:
+        offset += 3 + unpack_name(buffer, offset + 1)[0]
+        width = widths[tag_id]
+        if width:
+            offset += width
+        else:
+            offset = skippers[tag_id](buffer, offset)
+    return offset + 1
+
+def _skip_int_array(buffer, offset):
+    return offset + 4 + _int_format.unpack_from(buffer, offset)[0] * 4
+
+def _skip_long_array(buffer, offset):
+    return offset + 4 + _int_format.unpack_from(buffer, offset)[0] * 8
+
+def _iter_matches(buffer, offset, tag_id, steps, step):
+    """
+    Yields (tag_id, offset) for each payload below `offset` that matches
+    steps[step:]. Subtrees that do not match are skipped over by their
+    encoded lengths.
+    """
+    if step == len(steps):
+        yield tag_id, offset
         return
-    if type(tag) in _array_tag_types:
-        stream.write(_int_format.pack(len(tag.data)))
-        if type(tag) == t_bytes:
-            for v in tag.data:
-                stream.write(_sbyte_format.pack(v))
-            return
-        if type(tag) == t_ints:
-            for v in tag.data:
-                stream.write(_int_format.pack(v))
+    key = steps[step]
+    if type(key) is bytes:
+        if tag_id != 10:
             return
-        if type(tag) == t_longs:
-            for v in tag.data:
-                stream.write(_long_format.pack(v))
-            return
-    if type(tag) == t_string:
-        stream.write(_short_format.pack(len(tag.value)))
-        stream.write(tag.value.encode('utf-8'))
+        skippers = _payload_skippers
+        key_size = len(key)
+        while child_id := buffer[offset]:
+            size = _ushort_format.unpack_from(buffer, offset + 1)[0]
+            start = offset + 3 + size
+            if size == key_size and buffer[offset + 3:start] == key:
+                yield from _iter_matches(buffer, start, child_id, steps, step + 1)
+                return
+            offset = skippers[child_id](buffer, start)
         return
-    if type(tag) == t_list:
-        stream.write(_byte_format.pack(tag.type))
-        stream.write(_int_format.pack(len(tag.data)))
-        for v in tag.data:
-            write_tag_data(v, stream)
-        print('list')
+    if tag_id != 9:
         return
-    if type(tag) == t_compound:
-        for k, v in tag.data.items():
-            stream.write(_byte_format.pack(_tag_type_table[type(v)]))
-            stream.write(_ushort_format.pack(len(k)))
-            stream.write(k.encode('utf-8'))
-            write_tag_data(v)
-        stream.write(_byte_format.pack(0))
+    element_id, count = _list_header_format.unpack_from(buffer, offset)
+    offset += 5
+    if key is None:
+        first, last = 0, count - 1
+    else:
+        first = last = key if key >= 0 else count + key
+    if first < 0 or last >= count:
         return
+    width = _payload_widths[element_id]
+    if width:
+        for index in range(first, last + 1):
+            yield from _iter_matches(buffer, offset + index * width, element_id, steps, step + 1)
+        return
+    skip = _payload_skippers[element_id]
+    for index in range(last + 1):
+        if index >= first:
+            yield from _iter_matches(buffer, offset, element_id, steps, step + 1)
+        if index < last:
+            offset = skip(buffer, offset)
+
+class nbt_query:
+    """
+    A precompiled path into an NBT tree that is matched directly against the raw
+    (decompressed) bytes, without loading the tree.
+    Paths are relative to the root tag, with compound keys separated by '.' and
+    list elements selected by `[index]` or `[*]`, for example:
+        Level.xPos
+        Level.Sections[*].Palette[*].Name
+        Level.TileEntities[-1].id
+    Subtrees that are not on the path are skipped over by their encoded lengths,
+    and only the matched tags are decoded.
+    """
+    __slots__ = ('path', '_steps')
+
+    def __init__(self, path : str):
+        self.path = path
+        steps = []
+        for part in path.split('.') if path else ():
+            match = _query_part_pattern.fullmatch(part)
+            if match is None:
+                raise ValueError(f'Invalid query path: {path!r}')
+            name, indices = match.groups()
+            if name:
+                steps.append(name.encode('utf-8'))
+            for index in _query_index_pattern.findall(indices):
+                steps.append(None if index == '*' else int(index))
+        self._steps = tuple(steps)
+    
+    def locate(self, data):
+        """
+        Yields (tag_id, offset) for each match in `data`, where offset is the
+        position of the matched tag's payload.
+        """
+        size = _ushort_format.unpack_from(data, 1)[0]
+        return _iter_matches(data, 3 + size, data[0], self._steps, 0)
 
-def load(data : bytes) ->tuple:
+    def iterfind(self, data):
+        """
+        Yields each matching tag in `data`, which must be NBT data including the
+        root tag's id and name, as it is passed to load().
+        """
+        loaders = _payload_loaders
+        for tag_id, offset in self.locate(data):
+            yield loaders[tag_id](data, offset)[0]
+    
+    def findall(self, data) -> list:
+        """
+        Returns a list of every matching tag in `data`.
+        """
+        return list(self.iterfind(data))
+    
+    def find(self, data, default=None):
+        """
+        Returns the first matching tag in `data`, or `default` if there is none.
+        The search stops at the first match.
+        """
+        return next(self.iterfind(data), default)
+    
+    def patch(self, data, value) -> int:
+        """
+        Overwrites every matching tag in `data` with `value`, in place, without
+        parsing or re-encoding the rest of the tree.
+        Only fixed-size scalars (t_byte through t_double, including the elements
+        of numeric lists) can be patched, since their encoded size does not change.
+        : data :    A writable buffer, such as a bytearray of decompressed chunk data
+                    from RegionFile.read_chunk_raw().
+        : value :   An int or float, or a tag holding one.
+        Raises ValueError if a match is not a fixed-size scalar or value does not
+        fit its type, in which case nothing is written.
+        Returns the number of tags that were patched.
+        """
+        value = _tag_value(value)
+        formats = _payload_formats
+        matches = list(self.locate(data))
+        packed = {}
+        for tag_id, _ in matches:
+            if formats[tag_id] is None:
+                raise ValueError(f'{self.path} matches a {_tag_type_table[tag_id].__name__}, which can not be patched in place.')
+            if tag_id not in packed:
+                try:
+                    packed[tag_id] = formats[tag_id].pack(value)
+                except struct.error as e:
+                    raise ValueError(f'{value!r} does not fit a {_tag_type_table[tag_id].__name__}: {e}')
+        view = memoryview(data).cast('B')
+        for tag_id, offset in matches:
+            raw = packed[tag_id]
+            view[offset:offset + len(raw)] = raw
+        return len(matches)
+    
+    def __repr__(self):
+        return f'nbt_query({self.path!r})'
+
+def compile_query(path : str) -> nbt_query:
+    """
+    Compiles `path` into an nbt_query that can be run against raw NBT data many times.
+    """
+    return nbt_query(path)
+
+def patch_scalar(data, path : str, value) -> int:
+    """
+    Overwrites the fixed-size scalars matched by `path` in the raw NBT `data`,
+    in place. See nbt_query.patch().
+    Returns the number of tags that were patched.
+    """
+    return nbt_query(path).patch(data, value)
+
+# The _encode_* functions append a tag's payload to the bytearray `out`.
+# They are dispatched by tag type through _payload_encoders.
+
+def _encode_byte(tag, out):
+    out += _sbyte_format.pack(tag._value)
+
+def _encode_short(tag, out):
+    out += _short_format.pack(tag._value)
+
+def _encode_int(tag, out):
+    out += _int_format.pack(tag._value)
+
+def _encode_long(tag, out):
+    out += _long_format.pack(tag._value)
+
+def _encode_float(tag, out):
+    out += _float_format.pack(tag._value)
+
+def _encode_double(tag, out):
+    out += _double_format.pack(tag._value)
+
+def _encode_string(tag, out):
+    raw = tag._value.encode('utf-8')
+    out += _ushort_format.pack(len(raw))
+    out += raw
+
+def _encode_array(dtype, tag, out):
+    # This is a no-op for arrays that are already contiguous and big-endian.
+    data = numpy.ascontiguousarray(tag._data, dtype=dtype)
+    out += _int_format.pack(len(data))
+    out += memoryview(data).cast('B')
+
+# The container encoders take the table that their children are dispatched
+# through, which _cache_source() replaces to record where each one was encoded.
+
+def _encode_list(tag, out, encoders=None):
+    if tag._source is not None:
+        out += tag._source
+        return
+    items = tag._data
+    out += _list_header_format.pack(tag.type, len(items))
+    if type(items) == numpy.ndarray:
+        # Lists of numbers are appended as a single buffer.
+        data = numpy.ascontiguousarray(items, dtype=_list_array_dtypes[tag.type])
+        out += memoryview(data).cast('B')
+        return
+    if encoders is None:
+        encoders = _payload_encoders
+    for v in items:
+        encoders[type(v)](v, out)
+
+def _encode_compound(tag, out, encoders=None):
+    if tag._source is not None:
+        out += tag._source
+        return
+    if encoders is None:
+        encoders = _payload_encoders
+    types = _tag_type_table
+    for k, v in tag._data.items():
+        raw = k.encode('utf-8')
+        out += _entry_header_format.pack(types[type(v)], len(raw))
+        out += raw
+        encoders[type(v)](v, out)
+    out.append(0)
+
+def _encode_lazy_compound(tag, out, encoders=None):
+    if tag._index is None or tag._source is not None:
+        return _encode_compound(tag, out, encoders)
+    # Children that were never decoded are copied from the source buffer.
+    if encoders is None:
+        encoders = _payload_encoders
+    items = tag._data
+    buffer = tag._buffer
+    for k, (tag_id, start, end) in tag._index.items():
+        raw = k.encode('utf-8')
+        out += _entry_header_format.pack(tag_id, len(raw))
+        out += raw
+        v = items.get(k, None)
+        if v is None:
+            out += buffer[start:end]
+        else:
+            encoders[type(v)](v, out)
+    out.append(0)
+
+def _cache_source(tag) -> memoryview:
+    """
+    Encodes the payload of the container `tag` and returns it. Every container
+    in it that can not change without notice keeps the span it was encoded to
+    as its `_source`, so that it is copied rather than encoded from then on.
+    """
+    out = bytearray()
+    spans = []
+    def encode_span(v, out):
+        if v._source is not None:
+            out += v._source
+            return
+        start = len(out)
+        _payload_encoders[type(v)](v, out, encoders)
+        if not v._volatile:
+            spans.append((v, start, len(out)))
+    encoders = dict(_payload_encoders)
+    for container_type in _container_tag_types:
+        encoders[container_type] = encode_span
+    encode_span(tag, out)
+    buffer = memoryview(out)
+    for v, start, end in spans:
+        v._source = buffer[start:end]
+    return buffer
+
+def write_tag_data(tag : nbt_tag, stream):
+    """
+    Writes the payload of `tag` to `stream` with a single call to `stream.write`.
+    """
+    out = bytearray()
+    _payload_encoders[type(tag)](tag, out)
+    stream.write(out)
+
+def load(data : bytes, lazy : bool = False) ->tuple:
     """
     `data` must be in valid nbt format, including metadata (id and name).
+    `data` may be any bytes-like object (bytes, bytearray, memoryview). It is
+    walked by offset rather than through a stream, and array tags keep views over
+    `data` until they are written to or their `data` is accessed.
+    : lazy :    If True, compounds are returned as t_lazy_compound, which only
+                decode the children that are accessed.
+    Lists and compounds remember the span of `data` they were decoded from, and
+    are written by copying it until they are changed or hand out a child.
+    `data` is kept alive by the returned tree and must not be modified.
     Returns a tuple with the order of (tag, name).
     """
-    with io.BytesIO(data) as stream:
-        tag_id = _read_byte(stream)
-        name = _read_string(stream)
-        tag = read_tag_data(stream, tag_id)
-        return tag, name
+    buffer = memoryview(data)
+    if buffer.format != 'B':
+        buffer = buffer.cast('B')
+    tag_id = buffer[0]
+    size = _ushort_format.unpack_from(buffer, 1)[0]
+    name = _decode_string(buffer[3:3 + size])
+    loaders = _lazy_payload_loaders if lazy else _payload_loaders
+    tag, _ = loaders[tag_id](buffer, 3 + size)
+    return tag, name
 
 def dump(tag : nbt_tag, name : str = None) -> bytes:
     """
@@ -690,45 +1911,1164 @@ def dump(tag : nbt_tag, name : str = None) -> bytes:
     : tag :     The tag that you would like to convert to bytes.
     : name :    The name of the tag. If None, name will not be written.
     """
-    with io.BytesIO() as stream:
-        stream.write(_byte_format.pack(_tag_type_table[type(tag)]))
-        if name and len(name) > 0:
-            stream.write(_ushort_format(len(name)))
-            stream.write(name.encode('utf-8'))
+    out = bytearray()
+    raw = name.encode('utf-8') if name else b''
+    out += _entry_header_format.pack(_tag_type_table[type(tag)], len(raw))
+    out += raw
+    _payload_encoders[type(tag)](tag, out)
+    return bytes(out)
+
+# Native mode.
+# load_native() builds a tree of dicts, lists, Python scalars and numpy arrays
+# instead of tags. The tag type of every value is kept in a separate schema so
+# that dump_native() can write the tree back byte for byte. Schemas are:
+#   int :                                   The tag id of a value tag, string or array tag.
+#   (9, element_schema, item_schemas) :     A list. If every item has the same schema it is
+#                                           element_schema and item_schemas is None. Otherwise
+#                                           element_schema is the element tag id and item_schemas
+#                                           is a tuple with a schema for each item.
+#   (10, ((key, schema), ...)) :            A compound.
+# Equal schemas are shared, so a list of a thousand palette entries only holds one schema.
+
+def _schema_id(schema) -> int:
+    return schema if type(schema) is int else schema[0]
+
+def _load_native_value(unpack_from, width, tag_id, buffer, offset, schemas):
+    return unpack_from(buffer, offset)[0], tag_id, offset + width
+
+def _load_native_array(dtype, tag_id, buffer, offset, schemas):
+    size = _int_format.unpack_from(buffer, offset)[0]
+    offset += 4
+    return numpy.frombuffer(buffer, dtype, size, offset), tag_id, offset + size * dtype.itemsize
+
+def _load_native_string(buffer, offset, schemas):
+    size = _ushort_format.unpack_from(buffer, offset)[0]
+    offset += 2
+    return _decode_string(buffer[offset:offset + size]), 8, offset + size
+
+def _load_native_list(buffer, offset, schemas):
+    tag_id, size = _list_header_format.unpack_from(buffer, offset)
+    offset += 5
+    dtype = _list_array_dtypes[tag_id]
+    if dtype is not None and size > 0:
+        data = numpy.frombuffer(buffer, dtype, size, offset)
+        value = data.astype(_list_value_dtypes[tag_id])
+        return value, schemas.setdefault((9, tag_id, None), (9, tag_id, None)), offset + size * dtype.itemsize
+    loader = _native_loaders[tag_id]
+    items = []
+    item_schemas = []
+    for _ in range(size):
+        item, schema, offset = loader(buffer, offset, schemas)
+        items.append(item)
+        item_schemas.append(schema)
+    first = item_schemas[0] if item_schemas else tag_id
+    if all(schema is first for schema in item_schemas):
+        schema = (9, first, None)
+    else:
+        schema = (9, tag_id, tuple(item_schemas))
+    return items, schemas.setdefault(schema, schema), offset
+
+def _load_native_compound(buffer, offset, schemas):
+    loaders = _native_loaders
+    items = {}
+    fields = []
+    while tag_id := buffer[offset]:
+        size = _ushort_format.unpack_from(buffer, offset + 1)[0]
+        offset += 3
+        name = _decode_string(buffer[offset:offset + size])
+        items[name], schema, offset = loaders[tag_id](buffer, offset + size, schemas)
+        fields.append((name, schema))
+    schema = (10, tuple(fields))
+    return items, schemas.setdefault(schema, schema), offset + 1
+
+def _infer_schema(value):
+    """
+    Returns the schema that a native value would be written with if it has none.
+    ints become TAG_Int (or TAG_Long if they do not fit), floats become TAG_Double,
+    bytes become TAG_Byte_Array, and numpy values (and array.array, which is read
+    as a numpy array) keep the width of their dtype. Lists of numbers take the
+    narrowest type that holds all of them, so one float makes a TAG_Double list.
+    """
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, int):
+        return 3 if -2**31 <= value < 2**31 else 4
+    if isinstance(value, float):
+        return 6
+    if isinstance(value, str):
+        return 8
+    if isinstance(value, (bytes, bytearray)):
+        return 7
+    if isinstance(value, dict):
+        return (10, tuple((k, _infer_schema(v)) for k, v in value.items()))
+    if isinstance(value, array.array):
+        value = numpy.asarray(value)
+    if isinstance(value, numpy.ndarray):
+        kind = _array_schema_kinds.get(value.dtype.str[1:], None)
+        if kind is None:
+            raise TypeError(f'Can not convert an array of {value.dtype} to NBT.')
+        return kind
+    if isinstance(value, numpy.generic):
+        return _value_schema_kinds[value.dtype.str[1:]]
+    if isinstance(value, (list, tuple)):
+        if not value:
+            return (9, 0, None)
+        numbers = _number_array(value)
+        if numbers is not None:
+            return (9, numbers[0], None)
+        item_schemas = [_infer_schema(v) for v in value]
+        first = item_schemas[0]
+        if all(schema == first for schema in item_schemas):
+            return (9, first, None)
+        tag_ids = {_schema_id(schema) for schema in item_schemas}
+        if tag_ids <= _numeric_tag_ids:
+            # Numbers are widened to a type that holds all of them.
+            return (9, 6 if tag_ids & {5, 6} else max(tag_ids), None)
+        if len(tag_ids) > 1:
+            raise TypeError('Can not convert a list of mixed types to NBT.')
+        return (9, _schema_id(first), tuple(item_schemas))
+    raise TypeError(f'Can not convert {type(value).__name__} to NBT.')
+
+def _number_array(value):
+    """
+    Converts a flat list of Python numbers with one vectorized pass.
+    Returns (tag_id, array) with the tag id that _infer_schema() gives its
+    items, or None if it is not such a list.
+    """
+    if not value or type(value[0]) not in _scalar_types:
+        return None
+    items = numpy.asarray(value)
+    kind = items.dtype.kind
+    if kind == 'b':
+        return 1, items
+    if kind == 'i':
+        return (3 if -2**31 <= items.min() and items.max() < 2**31 else 4), items
+    if kind == 'f':
+        return 6, items
+    return None
+
+def _inferred_id(value) -> int:
+    # The tag id that _infer_schema() gives value, without walking into it.
+    if isinstance(value, dict):
+        return 10
+    if isinstance(value, (list, tuple)):
+        return 9
+    return _infer_schema(value)
+
+def _encode_inferred(value, out):
+    """
+    Writes the payload of a native value that has no schema, with the types that
+    _infer_schema() gives it. Compounds are walked here rather than through a
+    schema, so that each flat list of numbers is converted only once.
+    """
+    if isinstance(value, dict):
+        for k, v in value.items():
+            raw = k.encode('utf-8')
+            out += _entry_header_format.pack(_inferred_id(v), len(raw))
+            out += raw
+            _encode_inferred(v, out)
+        out.append(0)
+        return
+    if isinstance(value, (list, tuple)):
+        numbers = _number_array(value)
+        if numbers is not None:
+            tag_id, items = numbers
+            out += _list_header_format.pack(tag_id, len(items))
+            out += memoryview(items.astype(_list_array_dtypes[tag_id])).cast('B')
+            return
+        if value and isinstance(value[0], (dict, list, tuple)):
+            tag_id = _inferred_id(value[0])
+            if any(_inferred_id(v) != tag_id for v in value):
+                raise TypeError('Can not convert a list of mixed types to NBT.')
+            out += _list_header_format.pack(tag_id, len(value))
+            for v in value:
+                _encode_inferred(v, out)
+            return
+    schema = _infer_schema(value)
+    _native_encoders[_schema_id(schema)](value, schema, out)
+
+def _encode_native_value(pack, value, schema, out):
+    out += pack(value)
+
+def _encode_native_array(dtype, value, schema, out):
+    if isinstance(value, (bytes, bytearray)):
+        value = numpy.frombuffer(value, dtype=_byte_array_dtype)
+    data = numpy.ascontiguousarray(value, dtype=dtype)
+    out += _int_format.pack(len(data))
+    out += memoryview(data).cast('B')
+
+def _encode_native_string(value, schema, out):
+    raw = value.encode('utf-8')
+    out += _ushort_format.pack(len(raw))
+    out += raw
+
+def _encode_native_list(value, schema, out):
+    _, element_schema, item_schemas = schema
+    tag_id = _schema_id(element_schema)
+    if tag_id == 0 and len(value) > 0:
+        # The list was empty when it was loaded, so its items have no schema.
+        _, element_schema, item_schemas = _infer_schema(list(value))
+        tag_id = _schema_id(element_schema)
+    out += _list_header_format.pack(tag_id, len(value))
+    dtype = _list_array_dtypes[tag_id]
+    if dtype is not None:
+        data = numpy.ascontiguousarray(value, dtype=dtype)
+        out += memoryview(data).cast('B')
+        return
+    encode = _native_encoders[tag_id]
+    if item_schemas is None:
+        for item in value:
+            encode(item, element_schema, out)
+        return
+    # Items that were added after loading are not in item_schemas, and every item
+    # has to be written for the count to be right.
+    for i, item in enumerate(value):
+        if i < len(item_schemas):
+            item_schema = item_schemas[i]
         else:
-            stream.write(b'\x00\x00')
-        tag.write(stream)
-        return stream.getvalue()
-
-def dumps(tag : nbt_tag):
-    if type(tag) in {t_byte, t_short, t_int, t_long, t_float, t_double}:
-        print(tag.value)
-    if type(tag) is t_string:
-        print(repr(tag.value), end='')
-    if type(tag) in {t_bytes, t_ints, t_longs}:
-        first = True
-        print('[', end='')
-        for v in tag.data:
-            if not first:
-                print(', ', end='')
+            item_schema = _infer_schema(item)
+            if _schema_id(item_schema) != tag_id:
+                raise TypeError(f'Can not add {type(item).__name__} to a list of {_tag_type_table[tag_id].__name__}.')
+        encode(item, item_schema, out)
+
+def _encode_native_compound(value, schema, out):
+    encoders = _native_encoders
+    fields = schema[1]
+    lookup = None
+    for i, (k, v) in enumerate(value.items()):
+        # Fields are usually in the same order as when they were loaded.
+        if i < len(fields) and fields[i][0] == k:
+            field_schema = fields[i][1]
+        else:
+            if lookup is None:
+                lookup = dict(fields)
+            field_schema = lookup.get(k, None)
+            if field_schema is None:
+                field_schema = _infer_schema(v)
+        raw = k.encode('utf-8')
+        tag_id = _schema_id(field_schema)
+        out += _entry_header_format.pack(tag_id, len(raw))
+        out += raw
+        encoders[tag_id](v, field_schema, out)
+    out.append(0)
+
+def load_native(data : bytes) -> tuple:
+    """
+    Like load(), but builds the tree out of dicts, lists, Python scalars and numpy
+    arrays rather than nbt tags.
+    Numeric lists and array tags become numpy arrays. Array tags are read-only
+    big-endian views over `data`.
+    Returns a tuple with the order of (value, schema, name), where schema holds
+    the tag types needed to write the value back with dump_native().
+    """
+    tag_id = data[0]
+    size = _ushort_format.unpack_from(data, 1)[0]
+    name = _decode_string(data[3:3 + size])
+    value, schema, _ = _native_loaders[tag_id](data, 3 + size, {})
+    return value, schema, name
+
+def dump_native(value, schema = None, name : str = None) -> bytes:
+    """
+    Converts a tree of native values into NBT bytes.
+    : value :   A value as returned by load_native().
+    : schema :  The schema returned by load_native(). Values that are not in the
+                schema (such as keys that were added) have their type inferred.
+                If None, the types of every value are inferred.
+    : name :    The name of the root tag.
+    """
+    out = bytearray()
+    raw = name.encode('utf-8') if name else b''
+    if schema is None:
+        out += _entry_header_format.pack(_inferred_id(value), len(raw))
+        out += raw
+        _encode_inferred(value, out)
+        return bytes(out)
+    tag_id = _schema_id(schema)
+    out += _entry_header_format.pack(tag_id, len(raw))
+    out += raw
+    _native_encoders[tag_id](value, schema, out)
+    return bytes(out)
+
+class _InflatingReader:
+    """
+    A read-only stream that decompresses gzip or zlib data from another stream
+    as it is read, keeping only what has been decompressed but not read yet.
+    """
+    __slots__ = ('_stream', '_inflater', '_buffer', '_pending')
+
+    def __init__(self, stream, prefix : bytes = b''):
+        self._stream = stream
+        # 32 + MAX_WBITS detects either a gzip or a zlib header.
+        self._inflater = zlib.decompressobj(32 + zlib.MAX_WBITS)
+        self._buffer = bytearray()
+        # Compressed input that was not inflated yet.
+        self._pending = prefix
+    
+    def read(self, size : int = -1) -> bytes:
+        buffer = self._buffer
+        inflater = self._inflater
+        while size < 0 or len(buffer) < size:
+            if inflater.eof:
+                break
+            data = self._pending or self._stream.read(_stream_chunk_size)
+            if not data:
+                buffer += inflater.flush()
+                break
+            # Only as much as this read needs is inflated, so that highly
+            # compressible input does not pile up in the buffer.
+            buffer += inflater.decompress(data, 0 if size < 0 else size - len(buffer))
+            self._pending = inflater.unconsumed_tail
+        if size < 0 or size >= len(buffer):
+            result = bytes(buffer)
+            buffer.clear()
+            return result
+        with memoryview(buffer) as view:
+            result = bytes(view[:size])
+        del buffer[:size]
+        return result
+
+class _PrefixedReader:
+    """
+    A read-only stream that returns `prefix` before the rest of `stream`.
+    """
+    __slots__ = ('_stream', '_prefix')
+
+    def __init__(self, stream, prefix : bytes):
+        self._stream = stream
+        self._prefix = prefix
+    
+    def read(self, size : int = -1) -> bytes:
+        if not self._prefix:
+            return self._stream.read(size)
+        if 0 <= size <= len(self._prefix):
+            result = self._prefix[:size]
+            self._prefix = self._prefix[size:]
+            return result
+        result = self._prefix + self._stream.read(size - len(self._prefix) if size >= 0 else -1)
+        self._prefix = b''
+        return result
+
+class _DeflatingWriter:
+    """
+    A write-only stream that compresses everything written to it into another stream.
+    """
+    __slots__ = ('_stream', '_deflater')
+
+    def __init__(self, stream, wbits : int):
+        self._stream = stream
+        self._deflater = zlib.compressobj(wbits=wbits)
+    
+    def write(self, data):
+        self._stream.write(self._deflater.compress(data))
+    
+    def close(self):
+        self._stream.write(self._deflater.flush())
+
+def _write_payload(tag, out : bytearray, sink):
+    """
+    Encodes `tag` into `out`, handing `out` to sink.write and emptying it whenever
+    it grows past _stream_chunk_size. Containers are walked here so that only a
+    bounded part of the encoded tree is in memory at once.
+    """
+    tag_type = type(tag)
+    if tag_type in _container_tag_types and tag._source is not None:
+        _payload_encoders[tag_type](tag, out)
+    elif tag_type is t_compound or (tag_type is t_lazy_compound and tag._index is None):
+        types = _tag_type_table
+        for k, v in tag._data.items():
+            raw = k.encode('utf-8')
+            out += _entry_header_format.pack(types[type(v)], len(raw))
+            out += raw
+            _write_payload(v, out, sink)
+        out.append(0)
+    elif tag_type is t_list and type(tag._data) is list:
+        out += _list_header_format.pack(tag.type, len(tag._data))
+        for v in tag._data:
+            _write_payload(v, out, sink)
+    else:
+        _payload_encoders[tag_type](tag, out)
+    if len(out) >= _stream_chunk_size:
+        sink.write(bytes(out))
+        out.clear()
+
+def load_file(source) -> tuple:
+    """
+    Loads NBT from a file, such as level.dat or a playerdata file.
+    : source :  A path or a binary file object. The data may be gzip compressed,
+                zlib compressed or uncompressed, which is detected from its header.
+    The data is decompressed and parsed incrementally, so the full decompressed
+    data is never held in memory.
+    Returns a tuple with the order of (tag, name).
+    """
+    stream = open(source, 'rb') if isinstance(source, (str, os.PathLike)) else source
+    try:
+        prefix = stream.read(2)
+        if len(prefix) == 2 and (prefix == b'\x1f\x8b' or (prefix[0] & 0x0F == 8 and int.from_bytes(prefix, 'big') % 31 == 0)):
+            reader = _InflatingReader(stream, prefix)
+        else:
+            reader = _PrefixedReader(stream, prefix)
+        tag_id = _read_byte(reader)
+        name = _read_string(reader)
+        return read_tag_data(reader, tag_id), name
+    finally:
+        if stream is not source:
+            stream.close()
+
+def dump_file(tag : nbt_tag, target, name : str = None, compression : str = 'gzip'):
+    """
+    Writes an NBT tag to a file.
+    : tag :         The tag to write.
+    : target :      A path or a binary file object.
+    : name :        The name of the tag.
+    : compression : 'gzip' (the format of level.dat and playerdata), 'zlib', or None.
+    The tag is encoded and compressed incrementally rather than being encoded in
+    full first.
+    """
+    if compression not in _compression_wbits:
+        raise ValueError(f'Unknown compression: {compression!r}')
+    stream = open(target, 'wb') if isinstance(target, (str, os.PathLike)) else target
+    try:
+        wbits = _compression_wbits[compression]
+        sink = stream if wbits is None else _DeflatingWriter(stream, wbits)
+        out = bytearray()
+        raw = name.encode('utf-8') if name else b''
+        out += _entry_header_format.pack(_tag_type_table[type(tag)], len(raw))
+        out += raw
+        _write_payload(tag, out, sink)
+        sink.write(bytes(out))
+        if sink is not stream:
+            sink.close()
+    finally:
+        if stream is not target:
+            stream.close()
+
+class _list_frame:
+    __slots__ = ('type', 'size', 'count', 'offset')
+
+    def __init__(self, tag_type : int, size : int, offset : int):
+        self.type = tag_type
+        self.size = size
+        self.count = 0
+        self.offset = offset
+
+class nbt_writer:
+    """
+    Writes NBT to a file or stream one tag at a time, without building the tree first.
+    Containers are opened with begin_compound() or begin_list() and closed with
+    end(). Tags inside a compound need a name, and tags inside a list take None
+    as their name. Exactly one root tag can be written.
+        with nbt_writer('structure.nbt') as writer:
+            writer.begin_compound('')
+            writer.write_int('DataVersion', 2586)
+            writer.begin_list('entities', t_compound)
+            for entity in entities:
+                writer.begin_compound(None)
+                ...
+                writer.end()
+            writer.end()
+            writer.end()
+    Written bytes are handed to the target in chunks of about _stream_chunk_size.
+    A list that was opened without a count holds back everything from its header
+    onwards until it is ended and its count is filled in, so lists of unknown
+    size should be kept near the bottom of the tree where possible.
+    """
+    __slots__ = ('_stream', '_sink', '_out', '_base', '_stack', '_pending', '_done')
+
+    def __init__(self, target, compression : str = 'gzip'):
+        """
+        : target :      A path or a binary file object.
+        : compression : 'gzip', 'zlib', or None.
+        """
+        if compression not in _compression_wbits:
+            raise ValueError(f'Unknown compression: {compression!r}')
+        self._stream = open(target, 'wb') if isinstance(target, (str, os.PathLike)) else None
+        stream = target if self._stream is None else self._stream
+        wbits = _compression_wbits[compression]
+        self._sink = stream if wbits is None else _DeflatingWriter(stream, wbits)
+        self._out = bytearray()
+        # The offset in the output of the first byte in _out.
+        self._base = 0
+        self._stack = []
+        # Frames of lists that were opened without a count, outermost first.
+        self._pending = []
+        self._done = False
+    
+    def _begin(self, tag_id : int, name : str):
+        out = self._out
+        stack = self._stack
+        if stack and stack[-1] is not None:
+            frame = stack[-1]
+            if name is not None:
+                raise ValueError('Tags in a list can not have a name.')
+            if tag_id != frame.type:
+                raise ValueError(f'Can not write {_tag_type_table[tag_id].__name__} to a list of {_tag_type_table[frame.type].__name__}.')
+            if frame.size is not None and frame.count == frame.size:
+                raise ValueError(f'The list was opened with a size of {frame.size}.')
+            frame.count += 1
+            return
+        if not stack:
+            if self._done:
+                raise ValueError('The root tag has already been written.')
+            self._done = True
+            name = name or ''
+        elif name is None:
+            raise ValueError('Tags in a compound need a name.')
+        raw = name.encode('utf-8')
+        out += _entry_header_format.pack(tag_id, len(raw))
+        out += raw
+    
+    def _flush(self):
+        out = self._out
+        if len(out) < _stream_chunk_size:
+            return
+        # Nothing after the header of a list that is waiting for its count can be
+        # written yet.
+        end = self._pending[0].offset - self._base if self._pending else len(out)
+        if end > 0:
+            self._sink.write(bytes(out[:end]))
+            del out[:end]
+            self._base += end
+    
+    def begin_compound(self, name : str):
+        self._begin(10, name)
+        self._stack.append(None)
+    
+    def begin_list(self, name : str, tag_type, size : int = None):
+        """
+        Opens a list of tag_type (a tag class or id).
+        If size is None, the count is filled in when the list is ended.
+        """
+        tag_id = tag_type if type(tag_type) == int else _tag_type_table[tag_type]
+        self._begin(9, name)
+        frame = _list_frame(tag_id, size, self._base + len(self._out))
+        self._out += _list_header_format.pack(tag_id, size or 0)
+        self._stack.append(frame)
+        if size is None:
+            self._pending.append(frame)
+    
+    def end(self):
+        """
+        Closes the compound or list that was opened last.
+        """
+        if not self._stack:
+            raise ValueError('There is no compound or list to end.')
+        frame = self._stack.pop()
+        if frame is None:
+            self._out.append(0)
+        elif frame.size is None:
+            self._pending.remove(frame)
+            _int_format.pack_into(self._out, frame.offset - self._base + 1, frame.count)
+        elif frame.count != frame.size:
+            raise ValueError(f'The list was opened with a size of {frame.size}, but has {frame.count} tags.')
+        self._flush()
+    
+    def _write_value(self, tag_id : int, fmt : struct.Struct, name : str, value):
+        self._begin(tag_id, name)
+        self._out += fmt.pack(value)
+        self._flush()
+    
+    def write_byte(self, name : str, value : int):
+        self._write_value(1, _sbyte_format, name, value)
+    
+    def write_short(self, name : str, value : int):
+        self._write_value(2, _short_format, name, value)
+    
+    def write_int(self, name : str, value : int):
+        self._write_value(3, _int_format, name, value)
+    
+    def write_long(self, name : str, value : int):
+        self._write_value(4, _long_format, name, value)
+    
+    def write_float(self, name : str, value : float):
+        self._write_value(5, _float_format, name, value)
+    
+    def write_double(self, name : str, value : float):
+        self._write_value(6, _double_format, name, value)
+    
+    def write_string(self, name : str, value : str):
+        self._begin(8, name)
+        raw = value.encode('utf-8')
+        self._out += _ushort_format.pack(len(raw))
+        self._out += raw
+        self._flush()
+    
+    def write_array(self, name : str, value):
+        """
+        Writes a numpy array (or bytes) as the tag its dtype maps to: int8 and
+        uint8 as TAG_Byte_Array, int32 as TAG_Int_Array, int64 as TAG_Long_Array,
+        and int16, float32 and float64 as a list of numbers.
+        """
+        schema = _infer_schema(value)
+        tag_id = _schema_id(schema)
+        self._begin(tag_id, name)
+        _native_encoders[tag_id](value, schema, self._out)
+        self._flush()
+    
+    def write_tag(self, name : str, tag : nbt_tag):
+        """
+        Writes a tag that was already built, such as one from load().
+        """
+        self._begin(_tag_type_table[type(tag)], name)
+        # Encoded into _out only, since _flush knows which part of it can be written.
+        _payload_encoders[type(tag)](tag, self._out)
+        self._flush()
+    
+    def close(self):
+        """
+        Writes everything that is left and closes the target if it was given as a path.
+        Raises ValueError if a compound or list is still open.
+        """
+        try:
+            if self._stack:
+                raise ValueError(f'{len(self._stack)} compounds or lists were not ended.')
+            if self._out:
+                self._sink.write(bytes(self._out))
+                self._out.clear()
+            if type(self._sink) is _DeflatingWriter:
+                self._sink.close()
+        finally:
+            if self._stream is not None:
+                self._stream.close()
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        elif self._stream is not None:
+            self._stream.close()
+
+def iterparse(source, events : tuple = ('start', 'end', 'value')):
+    """
+    Walks NBT data incrementally and yields a tuple of (event, path, tag_id, value)
+    for each tag, similar to xml.etree.ElementTree.iterparse. No tag tree is built,
+    so memory use is bounded by the nesting depth and the largest single value.
+    : source :  A bytes-like object, a path, or any object with a `read` function,
+                such as an open file or a gzip.GzipFile.
+    : events :  The events to report. Other events are still parsed, but not yielded.
+    `path` is a tuple of compound keys and list indices, relative to the root tag,
+    so the root tag has a path of ().
+    The events are:
+        'start' :   A compound or list begins. `value` is the number of
+                    elements for lists and None for compounds.
+        'end' :     A compound or list ends. `value` is None.
+        'value' :   Any other tag. `value` is the decoded tag (t_int, t_longs, ...).
+    """
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        stream = io.BytesIO(source)
+    elif isinstance(source, (str, os.PathLike)):
+        stream = open(source, 'rb')
+    else:
+        stream = source
+    yield_start = 'start' in events
+    yield_end = 'end' in events
+    yield_value = 'value' in events
+    try:
+        tag_id = _read_byte(stream)
+        _read_string(stream)
+        pending = (tag_id, ())
+        # Each frame is [tag_id, path, element_id, count, index].
+        stack = []
+        while True:
+            if pending is not None:
+                tag_id, path = pending
+                pending = None
+                if tag_id == 10:
+                    if yield_start:
+                        yield ('start', path, 10, None)
+                    stack.append([10, path, 0, 0, 0])
+                elif tag_id == 9:
+                    element_id = _read_byte(stream)
+                    count = _read_int(stream)
+                    if yield_start:
+                        yield ('start', path, 9, count)
+                    stack.append([9, path, element_id, count, 0])
+                elif tag_id in _tag_type_table and tag_id:
+                    value = read_tag_data(stream, tag_id)
+                    if yield_value:
+                        yield ('value', path, tag_id, value)
+                else:
+                    raise ValueError(f'Invalid tag id {tag_id}.')
+            if not stack:
+                return
+            frame = stack[-1]
+            if frame[0] == 10:
+                raw = stream.read(1)
+                if not raw:
+                    raise EOFError('Unexpected end of NBT data.')
+                if raw[0] == 0:
+                    stack.pop()
+                    if yield_end:
+                        yield ('end', frame[1], 10, None)
+                    continue
+                pending = (raw[0], frame[1] + (_read_string(stream),))
             else:
-                first = False
-            print(v, end='')
-        print(']', end='')
-    if type(tag) is t_list:
-        tag : t_list
-        ltype = _tag_id_table.get(tag.type, 'NULL')
-        print(f'list<{ltype}>[')
-        for v in tag.data:
-            dumps(v)
-        print(']')
-    if type(tag) is t_compound:
-        tag : t_compound
-        print('compound\n{')
-        for k, v in tag.data.items():
-            print(repr(k), end=' : ')
-            dumps(v)
-        print('}')
+                if frame[4] >= frame[3]:
+                    stack.pop()
+                    if yield_end:
+                        yield ('end', frame[1], 9, None)
+                    continue
+                pending = (frame[2], frame[1] + (frame[4],))
+                frame[4] += 1
+    finally:
+        if stream is not source:
+            stream.close()
+
+def _array_of(tag) -> numpy.ndarray:
+    # The numpy array behind an array tag or a numeric t_list.
+    return tag._data
+
+def _diff(a, b, path : tuple, ops : list):
+    if a is b:
+        return
+    tag_id = _tag_type_table[type(b)]
+    if _tag_type_table[type(a)] != tag_id:
+        ops.append((path, 'set', b))
+        return
+    if tag_id == 10:
+        if a._source is not None and b._source is not None and a._source == b._source:
+            return
+        old = a._view()
+        new = b._view()
+        for k in old:
+            if k not in new:
+                ops.append((path + (k,), 'del', None))
+        for k, v in new.items():
+            if k in old:
+                _diff(old[k], v, path + (k,), ops)
+            else:
+                ops.append((path + (k,), 'set', v))
+        return
+    if tag_id == 9:
+        if a.type != b.type:
+            ops.append((path, 'set', b))
+        elif type(b._data) is numpy.ndarray:
+            _diff_array(a, b, path, ops)
+        elif a._source is None or b._source is None or a._source != b._source:
+            old = a._data
+            new = b._data
+            for i, (u, v) in enumerate(zip(old, new)):
+                _diff(u, v, path + (i,), ops)
+            # Only the tail of a list that grew or shrank is sent.
+            for i in range(len(old) - 1, len(new) - 1, -1):
+                ops.append((path + (i,), 'del', None))
+            for i in range(len(old), len(new)):
+                ops.append((path + (i,), 'set', new[i]))
+        return
+    if tag_id in (7, 11, 12):
+        _diff_array(a, b, path, ops)
+        return
+    if a.value != b.value:
+        ops.append((path, 'set', b))
+
+def _diff_array(a, b, path : tuple, ops : list):
+    old = _array_of(a)
+    new = _array_of(b)
+    if len(old) != len(new):
+        ops.append((path, 'set', b))
+        return
+    changed = numpy.flatnonzero(old != new)
+    if len(changed) == 0:
+        return
+    if len(changed) * 2 > len(new):
+        # Replacing the whole array is smaller than listing the changes.
+        ops.append((path, 'set', b))
+        return
+    values = new[changed]
+    values = t_list(b.type, values) if type(b) is t_list else type(b)(values)
+    ops.append((path, 'array', (changed.astype(_int_array_dtype), values)))
+
+def diff(a : nbt_tag, b : nbt_tag) -> list:
+    """
+    Returns a patch that turns `a` into `b`, as a list of (path, op, value) tuples.
+    `path` is a tuple of compound keys and list indices from the root, and op is one of:
+        'set' :     Adds or replaces the tag at path with value (a tag). A list
+                    index one past the end of the list appends to it.
+        'del' :     Removes the tag at path. value is None.
+        'array' :   Changes some elements of the array tag or numeric list at path.
+                    value is (indices, values), where indices is a numpy array and
+                    values is a tag of the same type holding the new elements.
+    Arrays and numeric lists are compared with a single vectorized comparison, and
+    subtrees that were parsed from identical bytes and not changed since are
+    skipped without being walked.
+    """
+    ops = []
+    _diff(a, b, (), ops)
+    return ops
+
+def apply_patch(tag : nbt_tag, patch : list) -> nbt_tag:
+    """
+    Applies a patch from diff() or decode_patch() to `tag` in place.
+    Returns the patched tag, which is a new tag only if the patch replaces the root.
+    """
+    for path, op, value in patch:
+        if op == 'array':
+            target = tag
+            for key in path:
+                target = target[key]
+            indices, values = value
+            target[indices] = _array_of(values)
+            continue
+        if not path:
+            if op == 'set':
+                tag = value.snapshot()
+                continue
+            if op == 'del':
+                raise ValueError('The root tag can not be deleted.')
+        parent = tag
+        for key in path[:-1]:
+            parent = parent[key]
+        key = path[-1]
+        if op == 'set':
+            if type(parent) is t_list and key == len(parent):
+                parent.append(value.snapshot())
+            else:
+                parent[key] = value.snapshot()
+        elif op == 'del':
+            del parent[key]
+        else:
+            raise ValueError(f'Unknown patch operation: {op!r}')
+    return tag
+
+def encode_patch(patch : list) -> bytes:
+    """
+    Encodes a patch into a compact binary form that decode_patch() can read.
+    Each operation is stored as its op code, its path and its value as an NBT payload.
+    """
+    out = bytearray()
+    out += _int_format.pack(len(patch))
+    for path, op, value in patch:
+        out += _byte_format.pack(_patch_op_codes[op])
+        out += _byte_format.pack(len(path))
+        for key in path:
+            if type(key) is str:
+                raw = key.encode('utf-8')
+                out += _entry_header_format.pack(0, len(raw))
+                out += raw
+            else:
+                out += _byte_format.pack(1)
+                out += _int_format.pack(key)
+        if op == 'set':
+            out += _byte_format.pack(_tag_type_table[type(value)])
+            _payload_encoders[type(value)](value, out)
+        elif op == 'array':
+            indices, values = value
+            _encode_array(_int_array_dtype, t_ints(indices), out)
+            out += _byte_format.pack(_tag_type_table[type(values)])
+            _payload_encoders[type(values)](values, out)
+    return bytes(out)
+
+def decode_patch(data : bytes) -> list:
+    """
+    Decodes a patch that was encoded with encode_patch().
+    """
+    buffer = memoryview(data)
+    loaders = _payload_loaders
+    count = _int_format.unpack_from(buffer, 0)[0]
+    offset = 4
+    patch = []
+    for _ in range(count):
+        op = _patch_ops[buffer[offset]]
+        depth = buffer[offset + 1]
+        offset += 2
+        path = []
+        for _ in range(depth):
+            if buffer[offset] == 0:
+                size = _ushort_format.unpack_from(buffer, offset + 1)[0]
+                offset += 3
+                path.append(_decode_string(buffer[offset:offset + size]))
+                offset += size
+            else:
+                path.append(_int_format.unpack_from(buffer, offset + 1)[0])
+                offset += 5
+        value = None
+        if op == 'set':
+            value, offset = loaders[buffer[offset]](buffer, offset + 1)
+        elif op == 'array':
+            indices, offset = _load_int_array(buffer, offset)
+            values, offset = loaders[buffer[offset]](buffer, offset + 1)
+            value = (indices._data, values)
+        patch.append((tuple(path), op, value))
+    return patch
+
+def nbytes_report(tag : nbt_tag, depth : int = 2) -> list:
+    """
+    Breaks the memory held by a tree down by subtree.
+    Returns a list of (path, nbytes) for tag and for each of its descendants up
+    to `depth` levels down, in tree order, where path is written the way
+    nbt_query takes it ('' for tag itself). Children of a t_lazy_compound that
+    were not decoded are listed by the size of their encoded bytes.
+    Nothing is decoded or taken out of the tree to build the report.
+    : tag :     The tag to measure.
+    : depth :   How many levels below tag to list.
+    """
+    report = []
+    _nbytes_report(tag, '', depth, report)
+    return report
+
+def _nbytes_report(tag, path : str, depth : int, report : list):
+    report.append((path, tag.nbytes))
+    if depth <= 0:
+        return
+    tag_type = type(tag)
+    if tag_type == t_list:
+        if type(tag._data) != numpy.ndarray:
+            for i, v in enumerate(tag._data):
+                _nbytes_report(v, f'{path}[{i}]', depth - 1, report)
+        return
+    if tag_type not in (t_compound, t_lazy_compound):
+        return
+    prefix = f'{path}.' if path else ''
+    if tag_type == t_lazy_compound and tag._index is not None:
+        items = tag._data
+        for k, (_, start, end) in tag._index.items():
+            if k in items:
+                _nbytes_report(items[k], prefix + k, depth - 1, report)
+            else:
+                report.append((prefix + k, end - start))
+        return
+    for k, v in tag._data.items():
+        _nbytes_report(v, prefix + k, depth - 1, report)
+
+def _snbt_string(value : str) -> str:
+    return '"' + value.replace('\\', '\\\\').replace('"', '\\"') + '"'
+
+def _snbt_key(key : str) -> str:
+    if _snbt_key_pattern.fullmatch(key):
+        return key
+    return _snbt_string(key)
+
+def _snbt_check_finite(value):
+    # SNBT has no spelling for NaN or infinity that reads back as a number.
+    if not math.isfinite(value):
+        raise ValueError(f'{value} can not be written as SNBT.')
+
+def _snbt_flush(parts : list, sink):
+    if len(parts) >= _snbt_flush_parts:
+        sink.write(''.join(parts))
+        parts.clear()
+
+def _write_snbt_value(suffix, tag, parts, sink, indent, level):
+    parts.append(f'{tag.value}{suffix}')
+
+def _write_snbt_float(tag, parts, sink, indent, level):
+    # Written with the shortest digits that read back as the same float32.
+    _snbt_check_finite(tag.value)
+    parts.append(str(numpy.float32(tag.value)) + 'f')
+
+def _write_snbt_double(tag, parts, sink, indent, level):
+    _snbt_check_finite(tag.value)
+    parts.append(f'{tag.value!r}d')
+
+def _write_snbt_string(tag, parts, sink, indent, level):
+    parts.append(_snbt_string(tag.value))
+
+def _write_snbt_array(prefix, suffix, tag, parts, sink, indent, level):
+    separator = f'{suffix},' if indent is None else f'{suffix}, '
+    values = tag._data.tolist()
+    if values:
+        parts.append(f'[{prefix};{separator.join(map(str, values))}{suffix}]')
+    else:
+        parts.append(f'[{prefix};]')
+
+def _write_snbt_list(tag, parts, sink, indent, level):
+    items = tag._data
+    if type(items) == numpy.ndarray:
+        suffix = _snbt_suffixes[tag.type]
+        separator = f'{suffix},' if indent is None else f'{suffix}, '
+        if tag.type in (5, 6) and not numpy.isfinite(items).all():
+            _snbt_check_finite(items[~numpy.isfinite(items)][0])
+        if tag.type == 5:
+            values = [str(v) for v in items]
+        else:
+            values = items.tolist()
+        if values:
+            parts.append(f'[{separator.join(map(str, values))}{suffix}]')
+        else:
+            parts.append('[]')
+        return
+    if not items:
+        parts.append('[]')
+        return
+    writers = _snbt_writers
+    if indent is None:
+        parts.append('[')
+        for i, v in enumerate(items):
+            if i:
+                parts.append(',')
+            writers[type(v)](v, parts, sink, indent, level + 1)
+            _snbt_flush(parts, sink)
+        parts.append(']')
+        return
+    inner = '\n' + ' ' * (indent * (level + 1))
+    parts.append('[')
+    for i, v in enumerate(items):
+        parts.append(',' + inner if i else inner)
+        writers[type(v)](v, parts, sink, indent, level + 1)
+        _snbt_flush(parts, sink)
+    parts.append('\n' + ' ' * (indent * level) + ']')
+
+def _write_snbt_compound(tag, parts, sink, indent, level):
+    items = tag._view()
+    if not items:
+        parts.append('{}')
+        return
+    writers = _snbt_writers
+    if indent is None:
+        parts.append('{')
+        for i, (k, v) in enumerate(items.items()):
+            parts.append(f',{_snbt_key(k)}:' if i else f'{_snbt_key(k)}:')
+            writers[type(v)](v, parts, sink, indent, level + 1)
+            _snbt_flush(parts, sink)
+        parts.append('}')
+        return
+    inner = '\n' + ' ' * (indent * (level + 1))
+    parts.append('{')
+    for i, (k, v) in enumerate(items.items()):
+        parts.append(f'{"," if i else ""}{inner}{_snbt_key(k)}: ')
+        writers[type(v)](v, parts, sink, indent, level + 1)
+        _snbt_flush(parts, sink)
+    parts.append('\n' + ' ' * (indent * level) + '}')
+
+def write_snbt(tag : nbt_tag, sink, indent : int = None):
+    """
+    Writes a tag as SNBT (the text format used in Minecraft commands) to a text sink.
+    The text is written in pieces as it is made, so only a small part of it is
+    ever held in memory.
+    : tag :     The tag to write.
+    : sink :    Anything with a `write` function that accepts str, such as a text
+                file or io.StringIO.
+    : indent :  If None, the text is written on one line with no spaces. Otherwise
+                compounds and lists of lists or compounds put each entry on its
+                own line, indented by this many spaces per level.
+    Raises ValueError for NaN and infinite floats and doubles, which SNBT can not
+    express as numbers.
+    """
+    parts = []
+    _snbt_writers[type(tag)](tag, parts, sink, indent, 0)
+    sink.write(''.join(parts))
+
+def dumps(tag : nbt_tag, indent : int = None) -> str:
+    """
+    Returns a tag as SNBT text. See write_snbt().
+    """
+    with io.StringIO() as sink:
+        write_snbt(tag, sink, indent)
+        return sink.getvalue()
+
+def _snbt_error(text : str, pos : int, expected : str):
+    found = repr(text[pos]) if pos < len(text) else 'end of text'
+    return ValueError(f'Expected {expected} at {pos} in SNBT, found {found}.')
+
+def _parse_snbt_quoted(text : str, pos : int) -> tuple:
+    match = _snbt_quoted_pattern.match(text, pos)
+    if match is None:
+        raise _snbt_error(text, pos, 'closing quote')
+    value = match.group(1) if match.group(1) is not None else match.group(2)
+    if '\\' in value:
+        value = _snbt_escape_pattern.sub(r'\1', value)
+    return value, match.end()
+
+def _parse_snbt_scalar(token : str) -> nbt_tag:
+    match = _snbt_number_pattern.fullmatch(token)
+    if match is None:
+        if token == 'true':
+            return t_byte(1)
+        if token == 'false':
+            return t_byte(0)
+        return t_string(token)
+    number, suffix = match.groups()
+    if suffix:
+        cls = _snbt_suffix_types[suffix.lower()]
+        return cls(float(number)) if cls in (t_float, t_double) else cls(int(number))
+    if '.' in number or 'e' in number or 'E' in number:
+        return t_double(float(number))
+    return t_int(int(number))
+
+def _parse_snbt_array(text : str, pos : int, prefix : str) -> tuple:
+    end = text.find(']', pos)
+    if end < 0:
+        raise _snbt_error(text, len(text), "']'")
+    body = text[pos:end]
+    values = [int(v.strip().rstrip('bBlL')) for v in body.split(',')] if body.strip() else []
+    cls, dtype = _snbt_array_types[prefix]
+    return cls(numpy.array(values, dtype=dtype)), end + 1
+
+def _parse_snbt_list(text : str, pos : int) -> tuple:
+    match = _snbt_array_pattern.match(text, pos)
+    if match is not None:
+        return _parse_snbt_array(text, match.end(), match.group(1))
+    space = _snbt_space_pattern
+    items = []
+    pos = space.match(text, pos).end()
+    if text.startswith(']', pos):
+        return t_list(0), pos + 1
+    while True:
+        tag, pos = _parse_snbt(text, pos)
+        if items and type(tag) != type(items[0]):
+            raise ValueError(f'SNBT list mixes {type(items[0]).__name__} and {type(tag).__name__} before {pos}.')
+        items.append(tag)
+        pos = space.match(text, pos).end()
+        if text.startswith(',', pos):
+            pos += 1
+        elif text.startswith(']', pos):
+            return t_list(type(items[0]), items), pos + 1
+        else:
+            raise _snbt_error(text, pos, "',' or ']'")
+
+def _parse_snbt_compound(text : str, pos : int) -> tuple:
+    space = _snbt_space_pattern
+    items = {}
+    pos = space.match(text, pos).end()
+    if text.startswith('}', pos):
+        return t_compound(items), pos + 1
+    while True:
+        if text.startswith(('"', "'"), pos):
+            key, pos = _parse_snbt_quoted(text, pos)
+        else:
+            match = _snbt_key_pattern.match(text, pos)
+            if match is None:
+                raise _snbt_error(text, pos, 'a key')
+            key, pos = match.group(), match.end()
+        pos = space.match(text, pos).end()
+        if not text.startswith(':', pos):
+            raise _snbt_error(text, pos, "':'")
+        items[key], pos = _parse_snbt(text, pos + 1)
+        pos = space.match(text, pos).end()
+        if text.startswith(',', pos):
+            pos = space.match(text, pos + 1).end()
+        elif text.startswith('}', pos):
+            return t_compound(items), pos + 1
+        else:
+            raise _snbt_error(text, pos, "',' or '}'")
+
+def _parse_snbt(text : str, pos : int) -> tuple:
+    pos = _snbt_space_pattern.match(text, pos).end()
+    if text.startswith('{', pos):
+        return _parse_snbt_compound(text, pos + 1)
+    if text.startswith('[', pos):
+        return _parse_snbt_list(text, pos + 1)
+    if text.startswith(('"', "'"), pos):
+        value, pos = _parse_snbt_quoted(text, pos)
+        return t_string(value), pos
+    match = _snbt_key_pattern.match(text, pos)
+    if match is None:
+        raise _snbt_error(text, pos, 'a value')
+    return _parse_snbt_scalar(match.group()), match.end()
+
+def loads(text : str) -> nbt_tag:
+    """
+    Parses SNBT text, such as the output of dumps(), into a tag.
+    Numbers without a suffix are read as t_int, or as t_double if they have a
+    decimal point or exponent, and true and false are read as t_byte.
+    Raises ValueError if the text is not valid SNBT.
+    """
+    tag, pos = _parse_snbt(text, 0)
+    pos = _snbt_space_pattern.match(text, pos).end()
+    if pos != len(text):
+        raise _snbt_error(text, pos, 'end of text')
+    return tag
 
 _tag_id_table = {
     1 : 'TAG_Byte',
@@ -782,6 +3122,7 @@ _tag_type_table = {
     t_string : 8,
     t_list : 9,
     t_compound : 10,
+    t_lazy_compound : 10,
     t_ints : 11,
     t_longs : 12
 }
@@ -797,6 +3138,26 @@ _long_format = struct.Struct('>q')
 _float_format = struct.Struct('>f')
 _double_format = struct.Struct('>d')
 
+_list_header_format = struct.Struct('>bi')
+
+# The op codes that encode_patch uses for each patch operation.
+_patch_ops = (None, 'set', 'del', 'array')
+_patch_op_codes = {'set' : 1, 'del' : 2, 'array' : 3}
+
+# The number of bytes that load_file reads and dump_file writes at a time.
+_stream_chunk_size = 65536
+# The zlib wbits for each compression that dump_file supports.
+_compression_wbits = {'gzip' : 31, 'zlib' : 15, None : None}
+
+# The pool used by _decode_string. It is emptied once it holds _string_pool_size strings.
+_string_pool = {}
+_string_pool_size = 8192
+_string_pool_max_length = 64
+_entry_header_format = struct.Struct('>BH')
+
+_query_part_pattern = re.compile(r'([^.\[\]]*)((?:\[(?:\*|-?\d+)\])*)')
+_query_index_pattern = re.compile(r'\[(\*|-?\d+)\]')
+
 _value_tag_types = {t_byte, t_short, t_int, t_long, t_float, t_double}
 _value_tag_format = {
     t_byte : _sbyte_format,
@@ -807,4 +3168,148 @@ _value_tag_format = {
     t_double : _double_format
 }
 
-_array_tag_types = {t_bytes, t_ints, t_longs}
\ No newline at end of file
+_array_tag_types = {t_bytes, t_ints, t_longs}
+_tag_id_bytes = [bytes((i,)) for i in range(13)]
+_container_tag_types = {t_list, t_compound, t_lazy_compound}
+
+_byte_array_dtype = numpy.dtype('>i1')
+_int_array_dtype = numpy.dtype('>i4')
+_long_array_dtype = numpy.dtype('>i8')
+
+# The dtypes that numeric t_lists are stored as, and the dtypes they are encoded as.
+_numeric_tag_ids = {1, 2, 3, 4, 5, 6}
+_scalar_types = {bool, int, float}
+_list_value_dtypes = [None] + [numpy.dtype(v) for v in ('i1', 'i2', 'i4', 'i8', 'f4', 'f8')] + [None] * 6
+_list_array_dtypes = [None] + [numpy.dtype(v) for v in ('>i1', '>i2', '>i4', '>i8', '>f4', '>f8')] + [None] * 6
+
+# SNBT output is flushed to the sink once this many pieces have been made.
+_snbt_flush_parts = 4096
+_snbt_suffixes = [None, 'b', 's', '', 'L', 'f', 'd'] + [None] * 6
+_snbt_suffix_types = {'b' : t_byte, 's' : t_short, 'l' : t_long, 'f' : t_float, 'd' : t_double}
+_snbt_array_types = {
+    'B' : (t_bytes, _byte_array_dtype),
+    'I' : (t_ints, _int_array_dtype),
+    'L' : (t_longs, _long_array_dtype)
+}
+_snbt_key_pattern = re.compile(r'[A-Za-z0-9._+-]+')
+_snbt_number_pattern = re.compile(r'([-+]?(?:\d+\.?\d*|\.\d+)(?:[eE][-+]?\d+)?)([bBsSlLfFdD]?)')
+_snbt_quoted_pattern = re.compile(r'"((?:[^"\\]|\\.)*)"|\'((?:[^\'\\]|\\.)*)\'', re.DOTALL)
+_snbt_escape_pattern = re.compile(r'\\(.)', re.DOTALL)
+_snbt_array_pattern = re.compile(r'\s*([BIL])\s*;')
+_snbt_space_pattern = re.compile(r'\s*')
+
+_payload_loaders = [
+    None,
+    _load_byte,
+    _load_short,
+    _load_int,
+    _load_long,
+    _load_float,
+    _load_double,
+    _load_byte_array,
+    _load_string,
+    _load_list,
+    _load_compound,
+    _load_int_array,
+    _load_long_array
+]
+
+_lazy_payload_loaders = list(_payload_loaders)
+_lazy_payload_loaders[9] = _load_lazy_list
+_lazy_payload_loaders[10] = _load_lazy_compound
+
+# The formats of the fixed-size scalars that nbt_query.patch can overwrite.
+_payload_formats = [None, _sbyte_format, _short_format, _int_format, _long_format, _float_format, _double_format] + [None] * 6
+
+# The size of each payload that has a fixed width, or 0 if it does not.
+_payload_widths = [0, 1, 2, 4, 8, 4, 8, 0, 0, 0, 0, 0, 0]
+
+_payload_skippers = [
+    None,
+    partial(_skip_fixed, 1),
+    partial(_skip_fixed, 2),
+    partial(_skip_fixed, 4),
+    partial(_skip_fixed, 8),
+    partial(_skip_fixed, 4),
+    partial(_skip_fixed, 8),
+    _skip_byte_array,
+    _skip_string,
+    _skip_list,
+    _skip_compound,
+    _skip_int_array,
+    _skip_long_array
+]
+
+_snbt_writers = {
+    t_byte : partial(_write_snbt_value, 'b'),
+    t_short : partial(_write_snbt_value, 's'),
+    t_int : partial(_write_snbt_value, ''),
+    t_long : partial(_write_snbt_value, 'L'),
+    t_float : _write_snbt_float,
+    t_double : _write_snbt_double,
+    t_bytes : partial(_write_snbt_array, 'B', 'b'),
+    t_string : _write_snbt_string,
+    t_list : _write_snbt_list,
+    t_compound : _write_snbt_compound,
+    t_lazy_compound : _write_snbt_compound,
+    t_ints : partial(_write_snbt_array, 'I', ''),
+    t_longs : partial(_write_snbt_array, 'L', 'L')
+}
+
+_payload_encoders = {
+    t_byte : _encode_byte,
+    t_short : _encode_short,
+    t_int : _encode_int,
+    t_long : _encode_long,
+    t_float : _encode_float,
+    t_double : _encode_double,
+    t_bytes : partial(_encode_array, _byte_array_dtype),
+    t_string : _encode_string,
+    t_list : _encode_list,
+    t_compound : _encode_compound,
+    t_lazy_compound : _encode_lazy_compound,
+    t_ints : partial(_encode_array, _int_array_dtype),
+    t_longs : partial(_encode_array, _long_array_dtype)
+}
+
+_native_loaders = [
+    None,
+    partial(_load_native_value, _sbyte_format.unpack_from, 1, 1),
+    partial(_load_native_value, _short_format.unpack_from, 2, 2),
+    partial(_load_native_value, _int_format.unpack_from, 4, 3),
+    partial(_load_native_value, _long_format.unpack_from, 8, 4),
+    partial(_load_native_value, _float_format.unpack_from, 4, 5),
+    partial(_load_native_value, _double_format.unpack_from, 8, 6),
+    partial(_load_native_array, _byte_array_dtype, 7),
+    _load_native_string,
+    _load_native_list,
+    _load_native_compound,
+    partial(_load_native_array, _int_array_dtype, 11),
+    partial(_load_native_array, _long_array_dtype, 12)
+]
+
+_native_encoders = [
+    None,
+    partial(_encode_native_value, _sbyte_format.pack),
+    partial(_encode_native_value, _short_format.pack),
+    partial(_encode_native_value, _int_format.pack),
+    partial(_encode_native_value, _long_format.pack),
+    partial(_encode_native_value, _float_format.pack),
+    partial(_encode_native_value, _double_format.pack),
+    partial(_encode_native_array, _byte_array_dtype),
+    _encode_native_string,
+    _encode_native_list,
+    _encode_native_compound,
+    partial(_encode_native_array, _int_array_dtype),
+    partial(_encode_native_array, _long_array_dtype)
+]
+
+# The schemas inferred for numpy arrays and scalars, keyed by dtype without byte order.
+_array_schema_kinds = {
+    'i1' : 7, 'u1' : 7, 'i4' : 11, 'i8' : 12,
+    'i2' : (9, 2, None), 'f4' : (9, 5, None), 'f8' : (9, 6, None)
+}
+_value_schema_kinds = {
+    'i1' : 1, 'u1' : 1, 'i2' : 2, 'i4' : 3, 'i8' : 4, 'f4' : 5, 'f8' : 6, 'b1' : 1,
+    'u2' : 3, 'u4' : 4, 'f2' : 5
+}
\ No newline at end of file
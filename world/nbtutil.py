@@ -1,7 +1,14 @@
 """
 nbtutil contains functions to help with NBT.
+
+to_python() and from_python() convert between nbt tags and plain Python values
+(dicts, lists, ints, floats, strs and arrays). They go through the encoded form
+of the tree, so both directions use the buffer based parsers and encoders in
+nbt rather than walking the tags one by one.
 """
+import array
 import numpy
+from . import nbt
 #   int
 #   float
 #   string
@@ -9,16 +16,100 @@ import numpy
 #   dict
 #   bool
 
+__all__ = ['to_python', 'from_python', 'schema_of', 'isconvertable', 'convert']
+
 __convertible_types = {
-    int,float,str,list,dict,bool,bytes,bytearray,
-    numpy.uint8, numpy.uint16, numpy.uint32, numpy.uint64,
+    int,float,str,list,tuple,dict,bool,bytes,bytearray,array.array,
+    numpy.int8, numpy.int16, numpy.int32, numpy.int64,
+    numpy.uint8, numpy.uint16, numpy.uint32,
     numpy.float16, numpy.float32, numpy.float64,
     numpy.ndarray
 }
 
+# array.array typecodes by numpy dtype, without byte order.
+_typecodes = {
+    'i1' : 'b', 'i2' : 'h', 'i4' : 'i', 'i8' : 'q', 'f4' : 'f', 'f8' : 'd'
+}
+
+def _arrays_to_array(value):
+    if type(value) == numpy.ndarray:
+        result = array.array(_typecodes[value.dtype.str[1:]])
+        result.frombytes(value.astype(value.dtype.newbyteorder('=')).tobytes())
+        return result
+    if type(value) == dict:
+        return {k : _arrays_to_array(v) for k, v in value.items()}
+    if type(value) == list:
+        return [_arrays_to_array(v) for v in value]
+    return value
+
+def _arrays_to_list(value):
+    if type(value) == numpy.ndarray:
+        return value.tolist()
+    if type(value) == dict:
+        return {k : _arrays_to_list(v) for k, v in value.items()}
+    if type(value) == list:
+        return [_arrays_to_list(v) for v in value]
+    return value
+
+_array_converters = {
+    'numpy' : None,
+    'array' : _arrays_to_array,
+    'list' : _arrays_to_list
+}
+
+def to_python(tag : nbt.nbt_tag, arrays : str = 'numpy'):
+    """
+    Converts a tag into dicts, lists, ints, floats and strs.
+    Compounds become dicts, lists of tags become lists, and scalars become their value.
+    : tag :     The tag to convert.
+    : arrays :  How array tags and numeric lists are returned:
+                'numpy' for numpy arrays (array tags are read-only big-endian views),
+                'array' for array.array,
+                'list' for lists of ints or floats, which makes the result JSON compatible.
+    """
+    if arrays not in _array_converters:
+        raise ValueError(f'Unknown array mode {arrays!r}.')
+    value, _, _ = nbt.load_native(nbt.dump(tag))
+    converter = _array_converters[arrays]
+    if converter is not None:
+        value = converter(value)
+    return value
+
+def schema_of(tag : nbt.nbt_tag):
+    """
+    Returns the schema of a tag, which from_python() takes as a type hint to
+    convert a value back to the same tag types.
+    """
+    return nbt.load_native(nbt.dump(tag))[1]
+
+def from_python(value, schema = None) -> nbt.nbt_tag:
+    """
+    Converts Python values into tags.
+    : value :   dicts, lists, tuples, ints, floats, strs, bools, bytes, numpy
+                arrays and scalars, and array.array.
+    : schema :  A type hint such as the one returned by schema_of() or
+                nbt.load_native(). It is either a tag id (1 for TAG_Byte through
+                12 for TAG_Long_Array), (9, element_schema, None) for a list, or
+                (10, ((name, schema), ...)) for a compound. Values that it does
+                not cover have their type inferred: ints become TAG_Int (or
+                TAG_Long), floats TAG_Double, bools TAG_Byte, bytes TAG_Byte_Array
+                and numpy values keep the width of their dtype. Lists of numbers
+                take a type that holds all of them (TAG_Double if any is a float).
+    """
+    tag, _ = nbt.load(nbt.dump_native(value, schema))
+    return tag
+
 def isconvertable(cls : type):
     return cls in __convertible_types
 
-def convert(value):
+def convert(value, schema = None):
+    """
+    Converts a tag to Python values with to_python(), or Python values to a tag
+    with from_python().
+    Returns None if value can not be converted.
+    """
+    if isinstance(value, nbt.nbt_tag):
+        return to_python(value)
     if not isconvertable(type(value)):
-        return None
\ No newline at end of file
+        return None
+    return from_python(value, schema)
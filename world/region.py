@@ -7,6 +7,10 @@ from os import path
 import gzip
 import zlib
 import io
+import mmap
+import struct
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
 import numpy
 import math
 import bisect
@@ -16,6 +20,15 @@ from . import chunk
 
 null_sector = bytes(4096)
 
+# The length and compression type at the start of each chunk's sectors.
+_chunk_header_format = struct.Struct('>IB')
+_header_entry_format = struct.Struct('>I')
+# Batched reads also read gaps of up to this many unused sectors between chunks,
+# rather than splitting the read in two.
+_max_read_gap = 4
+# 1 GZip, 2 Zlib, 3 uncompressed
+_decompressors = {1 : gzip.decompress, 2 : zlib.decompress, 3 : bytes}
+
 __all__ = ['Sector', 'RegionFile']
 
 class Sector(object):
@@ -77,6 +90,31 @@ class Sector(object):
     def __repr__(self):
         return f'Sector(offset={self.offset}, count={self.count})'
 
+def _index_coords(indices : numpy.ndarray) -> numpy.ndarray:
+    """
+    Converts an array of chunk indices into an array of shape (n, 2) of (x, z)
+    coordinates. The vectorized form of RegionFile.expand_index.
+    """
+    return numpy.stack((indices & 31, indices >> 5), axis=1)
+
+def _find_free_run(used : numpy.ndarray, count : int) -> int:
+    """
+    Returns the first sector of the first run of at least `count` unused sectors,
+    or None if there is none.
+    """
+    free = numpy.concatenate(([False], ~used, [False]))
+    # Runs of free sectors start and end where free changes.
+    edges = numpy.flatnonzero(free[1:] != free[:-1])
+    starts = edges[0::2]
+    fits = numpy.flatnonzero(edges[1::2] - starts >= count)
+    if len(fits) == 0:
+        return None
+    return int(starts[fits[0]])
+
+def _decode_payload(parse : bool, decompress, data : bytes):
+    data = decompress(data)
+    return nbt.load(data)[0] if parse else data
+
 class RegionFile:
     """
     Class used to represent Minecraft Region files in the Anvil file format.
@@ -87,7 +125,7 @@ class RegionFile:
     # putting each chunk into a seperate files for easy modification.
     # Once the user is done modifying the chunks, they can save them back into the region file.
 
-    __slots__ = ('filename','chunk_sectors','loaded_chunks','loaded_indices')
+    __slots__ = ('filename','offsets','sector_counts','timestamps','loaded_chunks','loaded_indices','_file','_map')
 
     @staticmethod
     def get_index(x : int, z : int):
@@ -111,48 +149,233 @@ class RegionFile:
 
     def __init__(self, filename : str):
         self.filename = filename
-        self.chunk_sectors = numpy.ndarray(shape=(1024), dtype=numpy.object_)
         self.loaded_chunks = dict()
         self.loaded_indices = set()
+        self._file = None
+        self._map = None
         if not os.path.exists(self.filename):
             raise FileNotFoundError(self.filename)
-        if path.isfile(filename):
-            with open(self.filename, 'rb') as f:
-                f.seek(0, os.SEEK_END)
-                size = f.tell()
-                f.seek(0)
-
-                for i in range(1024):
-                    offset = int.from_bytes(f.read(3), byteorder='big', signed=False)
-                    sector_count = int.from_bytes(f.read(1), byteorder='big', signed=False)
-                    if offset >= 2 and sector_count > 0:
-                        sector = Sector(offset, sector_count)
-                        self.chunk_sectors[i] = sector
-                    else:
-                        self.chunk_sectors[i] = None
+        self._open()
+        self._read_header(self._map[:8192] if self._map is not None else b'')
     
-    def save(self):
-
+    def _open(self):
+        """
+        Opens the file and maps it into memory, where it stays until close().
+        """
+        if not path.isfile(self.filename):
+            return
+        self._file = open(self.filename, 'rb')
+        # Empty files can not be mapped, and have no chunks to read anyway.
+        if os.fstat(self._file.fileno()).st_size > 0:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+    
+    def close(self):
+        """
+        Closes the file. Chunks can not be read or saved after this.
+        """
+        if self._map is not None:
+            self._map.close()
+            self._map = None
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+    
+    def __enter__(self):
+        return self
+    
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+    
+    def _read_header(self, header : bytes):
+        """
+        Decodes the 8 KiB header into the offsets, sector_counts and timestamps arrays.
+        The first 4 KiB holds a 3 byte sector offset and a 1 byte sector count for
+        each chunk, and the second 4 KiB holds the time each chunk was last saved.
+        """
+        # Files that are shorter than the header are read as if they were padded with zeros.
+        table = numpy.zeros(2048, dtype=numpy.uint32)
+        size = len(header) // 4
+        table[:size] = numpy.frombuffer(header, dtype='>u4', count=size)
+        locations = table[:1024]
+        self.offsets = locations >> 8
+        self.sector_counts = locations & 0xFF
+        self.timestamps = table[1024:].copy()
+    
+    def _header_bytes(self) -> bytes:
+        table = numpy.empty(2048, dtype='>u4')
+        table[:1024] = numpy.where(self.present, (self.offsets << 8) | self.sector_counts, 0)
+        table[1024:] = self.timestamps
+        return table.tobytes()
+    
+    @property
+    def present(self) -> numpy.ndarray:
+        """
+        A boolean array with an entry for each chunk index that is True if the chunk
+        is stored in the file.
+        """
+        return (self.offsets >= 2) & (self.sector_counts > 0)
+    
+    @property
+    def chunk_sectors(self) -> numpy.ndarray:
+        """
+        An array of the Sector of each chunk index, or None for chunks that are not
+        stored in the file.
+        """
+        result = numpy.ndarray(shape=(1024,), dtype=numpy.object_)
+        for i in numpy.flatnonzero(self.present).tolist():
+            result[i] = Sector(int(self.offsets[i]), int(self.sector_counts[i]))
+        return result
+    
+    @property
+    def used_sectors(self) -> int:
+        """
+        The number of 4 KiB sectors used by chunks, not counting the header.
+        """
+        return int(self.sector_counts[self.present].sum())
+    
+    def existing_chunks(self) -> numpy.ndarray:
+        """
+        Returns an array of shape (n, 2) of the (x, z) coordinates of every chunk
+        that is stored in the file.
+        """
+        return _index_coords(numpy.flatnonzero(self.present))
+    
+    def modified_after(self, time) -> numpy.ndarray:
+        """
+        Returns an array of shape (n, 2) of the (x, z) coordinates of every chunk
+        that was last saved after `time`.
+        : time : A Unix timestamp, datetime, or anything else that arrow.get accepts.
+        """
+        if not isinstance(time, (int, float)):
+            time = arrow.get(time).timestamp()
+        return _index_coords(numpy.flatnonzero(self.present & (self.timestamps > time)))
+    
+    def chunk_timestamp(self, offsetX : int, offsetZ : int) -> arrow.Arrow:
+        """
+        Returns when the chunk was last saved, or None if it is not in the file.
+        """
+        ind = RegionFile.get_index(offsetX, offsetZ)
+        if not self.present[ind]:
+            return None
+        return arrow.get(int(self.timestamps[ind]))
+    
+    @staticmethod
+    def _encode_chunk(loaded_chunk : chunk.Chunk) -> bytes:
+        """
+        Returns a chunk's data as it is stored in the file: its length, compression
+        type and zlib compressed NBT, padded to a whole number of sectors.
+        """
+        # TODO: Eventually I plan on writing a save function for Chunk that doesn't require converting to NBT.
+        chunk_data = zlib.compress(nbt.dump(loaded_chunk.to_nbt()))
+        total_size = len(chunk_data) + 5
+        pad_size = -total_size % 4096
+        if (total_size + pad_size) // 4096 > 255:
+            raise ValueError(f'Chunk {loaded_chunk.xPos}, {loaded_chunk.zPos} does not fit in 255 sectors.')
+        return _chunk_header_format.pack(len(chunk_data) + 1, 2) + chunk_data + bytes(pad_size)
+    
+    def _used_sectors_map(self, size : int) -> numpy.ndarray:
+        """
+        Returns a boolean array with an entry for each of the first `size` sectors
+        of the file, which is True for the header and for sectors used by chunks.
+        """
+        present = self.present
+        starts = self.offsets[present].astype(numpy.int64)
+        ends = starts + self.sector_counts[present]
+        size = max(size, int(ends.max()) if len(ends) else 2)
+        # +1 at the start of each chunk and -1 after its end, so the running sum is
+        # the number of chunks using each sector.
+        marks = numpy.zeros(size + 1, dtype=numpy.int64)
+        numpy.add.at(marks, starts, 1)
+        numpy.add.at(marks, ends, -1)
+        used = numpy.cumsum(marks[:size]) > 0
+        used[:2] = True
+        return used
+    
+    def save(self, in_place : bool = False):
+        """
+        Writes the chunks in loaded_chunks that are dirty to the file.
+        : in_place :    If False, the whole file is rewritten (see _save_copy), which
+                        leaves no unused space behind.
+                        If True, only the dirty chunks and their header entries are
+                        written (see _save_in_place), which is much less I/O for large
+                        files but is not atomic, and leaves the space that chunks moved
+                        out of unused until it is reused by another chunk.
+        """
+        if not os.path.isfile(self.filename):
+            raise FileNotFoundError(self.filename)
+        if self._file is None:
+            raise ValueError(f'{self.filename} is closed.')
+        if in_place:
+            self._save_in_place()
+        else:
+            self._save_copy()
+    
+    def _save_in_place(self):
+        """
+        Writes each dirty chunk over its old sectors if it still fits, or else into
+        the first gap of unused sectors that is big enough, or else at the end of
+        the file. Only the chunk data and the header and timestamp entries of the
+        chunks that were written are changed.
+        """
+        dirty = sorted((RegionFile.get_index(x, z), loaded_chunk) for (x, z), loaded_chunk in self.loaded_chunks.items() if loaded_chunk.isDirty)
+        if not dirty:
+            return
+        file_sectors = -(-os.fstat(self._file.fileno()).st_size // 4096)
+        used = self._used_sectors_map(file_sectors)
+        now = int(arrow.utcnow().timestamp())
+        with open(self.filename, 'r+b') as outfile:
+            for ind, loaded_chunk in dirty:
+                data = RegionFile._encode_chunk(loaded_chunk)
+                count = len(data) // 4096
+                old_offset = int(self.offsets[ind])
+                old_count = int(self.sector_counts[ind])
+                if self.present[ind]:
+                    used[old_offset:old_offset + old_count] = False
+                if self.present[ind] and count <= old_count:
+                    offset = old_offset
+                else:
+                    offset = _find_free_run(used, count)
+                    if offset is None:
+                        offset = len(used)
+                if offset + count > len(used):
+                    used = numpy.concatenate((used, numpy.zeros(offset + count - len(used), dtype=bool)))
+                used[offset:offset + count] = True
+                outfile.seek(offset * 4096)
+                outfile.write(data)
+                self.offsets[ind] = offset
+                self.sector_counts[ind] = count
+                self.timestamps[ind] = now
+                outfile.seek(ind * 4)
+                outfile.write(_header_entry_format.pack((offset << 8) | count))
+                outfile.seek(4096 + ind * 4)
+                outfile.write(_header_entry_format.pack(now))
+                loaded_chunk.isDirty = False
+        # The map does not cover anything that was appended, so it is mapped again.
+        self.close()
+        self._open()
+    
+    def _save_copy(self):
         """
         This function will first create a temporary output file to write to.
         It will then read through the region file extracting data to write to the output file.
         When it encounters a chunk that has been loaded, it will write that chunk to the file instead
         of the data that is in the region file.
         """
-        if not os.path.isfile(self.filename):
-            raise FileNotFoundError(self.filename)
         # Create temporary output file to write to.
         output_path = self.filename + '.out'
         with open(output_path, 'wb') as outfile:
-            # Open the region file that this instance points to.
-            with open(self.filename, 'rb') as infile:
+            # Chunks that are not rewritten are copied straight out of the memory map.
+            with memoryview(self._map if self._map is not None else b'') as infile:
                 # First write 8192 bytes to the file.
                 # This is where sector information and timestamps are stored.
                 outfile.write(null_sector)
                 outfile.write(null_sector)
                 # First write all the chunk data while saving the sector information.
                 # After writing all the chunk data, seek to the beginning of the file and write the header data.
-                new_sectors = numpy.ndarray(shape=(1024,), dtype=numpy.object_)
+                new_offsets = numpy.zeros(1024, dtype=numpy.uint32)
+                new_counts = numpy.zeros(1024, dtype=numpy.uint32)
+                present = self.present
+                now = int(arrow.utcnow().timestamp())
 
                 # Loop through the 1024 possible chunks and write them to the file if they exist in some manner.
                 for i in range(1024):
@@ -168,43 +391,32 @@ class RegionFile:
                     loaded_chunk = self.loaded_chunks.get(coord, None)
                     
                     if loaded_chunk is not None and loaded_chunk.isDirty:
-                        # TODO: Eventually I plan on writing a save function for Chunk that doesn't require converting to NBT.
-                        chunk_nbt = loaded_chunk.to_nbt()
-                        chunk_data = zlib.compress(nbt.dump(chunk_nbt))
-                        chunk_size = len(chunk_data)
-                        data_length = chunk_size + 1
-                        total_size = chunk_size + 5
-                        pad_size = 0 if ((total_size) % 4096) == 0 else (4096 - (total_size % 4096))
-                        padded_size = total_size + pad_size
-                        new_sect.count = padded_size // 4096
-                        outfile.write(data_length.to_bytes(4, 'big', signed=False))
-                        outfile.write(b'\x02')
+                        chunk_data = RegionFile._encode_chunk(loaded_chunk)
+                        new_sect.count = len(chunk_data) // 4096
                         outfile.write(chunk_data)
-                        outfile.write(bytes(pad_size))
                         loaded_chunk.isDirty = False
+                        self.timestamps[i] = now
                     else:
                         # The chunk hasn't been loaded, so we'll just write it from the infile.
-                        sect = self.chunk_sectors[i]
-                        if sect is not None:
-                            infile.seek(sect.offset * 4096)
-                            outfile.write(infile.read(4096 * sect.count))
-                            new_sect.count = sect.count
+                        if present[i]:
+                            start = int(self.offsets[i]) * 4096
+                            outfile.write(infile[start:start + 4096 * int(self.sector_counts[i])])
+                            new_sect.count = int(self.sector_counts[i])
                         else:
                             new_sect.offset = 0
                             new_sect.count = 0
-                    new_sectors[i] = new_sect if new_sect.count > 0 and new_sect.offset >= 2 else None
-                self.chunk_sectors = new_sectors
-                # Now we will write the sector information to the file.
+                    new_offsets[i] = new_sect.offset
+                    new_counts[i] = new_sect.count
+                self.offsets = new_offsets
+                self.sector_counts = new_counts
+                # Now we will write the sector information and timestamps to the file.
                 outfile.seek(0)
-                null_data4 = b'\x00\x00\x00\x00'
-                for i in range(1024):
-                    if new_sectors[i] is not None:
-                        outfile.write(new_sectors[i].offset.to_bytes(3, 'big', signed=False))
-                        outfile.write(new_sectors[i].count.to_bytes(1, 'big', signed=False))
-                    else:
-                        outfile.write(null_data4)
+                outfile.write(self._header_bytes())
         # Now we are done writing to the output file, so we will swap it with the original.
+        # The old file has to be unmapped first, and the new one is mapped in its place.
+        self.close()
         os.replace(output_path, self.filename)
+        self._open()
 
     def read_chunk(self, offsetX : int, offsetZ : int) -> chunk.Chunk:
         if (offsetX, offsetZ) in self.loaded_chunks:
@@ -216,6 +428,77 @@ class RegionFile:
             self.loaded_indices.add(RegionFile.get_index(offsetX, offsetZ))
             return ch
     
+    def read_chunks(self, coords) -> list:
+        """
+        Reads many chunks at once, like calling read_chunk for each of them.
+        See read_chunks_raw for how the file is read.
+        : coords :  An iterable of (offsetX, offsetZ).
+        Returns a list with the Chunk (or None) of each coordinate, in the same order.
+        """
+        # loaded_chunks is keyed on tuples, so lists and arrays of two ints are accepted too.
+        coords = [tuple(coord) for coord in coords]
+        results = [self.loaded_chunks.get(coord, None) for coord in coords]
+        missing = [i for i, ch in enumerate(results) if ch is None]
+        raw = self.read_chunks_raw([coords[i] for i in missing])
+        for i, data in zip(missing, raw):
+            if data is None:
+                continue
+            coord = coords[i]
+            ch = self.loaded_chunks.get(coord, None)
+            if ch is None:
+                ch = chunk.Chunk(nbt.load(data)[0])
+                self.loaded_chunks[coord] = ch
+                self.loaded_indices.add(RegionFile.get_index(*coord))
+            results[i] = ch
+        return results
+    
+    def read_chunks_raw(self, coords) -> list:
+        """
+        Reads the decompressed NBT data of many chunks at once.
+        The chunks are read in the order they are stored in the file rather than the
+        order they are asked for, and each run of chunks that are next to each other
+        (or only a few sectors apart) is requested from the OS as a single read, so
+        the file is read sequentially.
+        : coords :  An iterable of (offsetX, offsetZ).
+        Returns a list with the data (or None) of each coordinate, in the same order.
+        """
+        indices = numpy.array([RegionFile.get_index(x, z) for x, z in coords], dtype=numpy.int64)
+        results = [None] * len(indices)
+        wanted = numpy.flatnonzero(self.present[indices])
+        if len(wanted) == 0:
+            return results
+        # The positions in coords of the chunks that are in the file, by file offset.
+        order = wanted[numpy.argsort(self.offsets[indices[wanted]], kind='stable')]
+        starts = self.offsets[indices[order]].astype(numpy.int64)
+        ends = starts + self.sector_counts[indices[order]]
+        self._prefetch(starts, ends)
+        payloads = {}
+        for i in order.tolist():
+            ind = int(indices[i])
+            if ind not in payloads:
+                payloads[ind] = self._read_payload(ind)
+            results[i] = payloads[ind]
+        return results
+    
+    def _prefetch(self, starts : numpy.ndarray, ends : numpy.ndarray):
+        """
+        Asks the OS to read the sectors from starts to ends (sorted by start) ahead of
+        time, merging ranges that are close together into single reads.
+        """
+        if self._map is None or not hasattr(mmap, 'MADV_WILLNEED'):
+            return
+        # A new run begins wherever a range starts too far past the furthest end so far.
+        reach = numpy.maximum.accumulate(ends)
+        breaks = numpy.flatnonzero(starts[1:] > reach[:-1] + _max_read_gap) + 1
+        run_starts = starts[numpy.concatenate(([0], breaks))]
+        run_ends = reach[numpy.concatenate((breaks - 1, [len(starts) - 1]))]
+        size = len(self._map)
+        for start, end in zip((run_starts * 4096).tolist(), (run_ends * 4096).tolist()):
+            # madvise needs a page aligned start.
+            start -= start % mmap.PAGESIZE
+            if start < size:
+                self._map.madvise(mmap.MADV_WILLNEED, start, min(end, size) - start)
+    
     def unload_chunk(self, offsetX : int, offsetZ : int) -> None:
         if (offsetX, offsetZ) in self.loaded_chunks:
             del self.loaded_chunks[offsetX, offsetZ]
@@ -225,54 +508,111 @@ class RegionFile:
         """
         Reads the chunk (decompressed) from the region file and returns the NBT.
         """
-        if not os.path.exists(self.filename):
-            raise FileNotFoundError(self.filename)
-        decompressed_data = None
-        ind = ((offsetX & 31) + (offsetZ & 31) * 32)
-
-        with open(self.filename,'rb') as f:
-            f.seek(ind * 4)
-            chunk_offset = int.from_bytes(f.read(3),'big')
-            if chunk_offset == 0:
-                return None
-            f.seek(chunk_offset * 4096)
-            data_length = int.from_bytes(f.read(4),'big')
-            compression_type = int.from_bytes(f.read(1),'big')
-            # 1 GZip, 2 Zlib, 3 uncompressed
-            if compression_type == 2:
-                return nbt.load(zlib.decompress(f.read(data_length-1)))
-            elif compression_type == 1:
-                return nbt.load(gzip.decompress(f.read(data_length-1)))
-            elif compression_type == 3:
-                return nbt.load(f.read(data_length-1))
+        data = self.read_chunk_raw(offsetX, offsetZ)
+        if data is not None:
+            return nbt.load(data)
 
     # TODO: Determine if this function is necessary.
     def read_chunk_raw(self, offsetX : int, offsetZ : int) -> bytes:
-        if not os.path.exists(self.filename):
-            raise FileNotFoundError(self.filename)
-        decompressed_data = None
-        ind = ((offsetX & 31) + (offsetZ & 31) * 32)
-
-        with open(self.filename,'rb') as f:
-            f.seek(ind * 4)
-            chunk_offset = int.from_bytes(f.read(3),'big')
-            if chunk_offset == 0:
-                return
-            f.seek(chunk_offset * 4096)
-            data_length = int.from_bytes(f.read(4),'big')
-            compression_type = int.from_bytes(f.read(1),'big')
-            # 1 GZip, 2 Zlib, 3 uncompressed
-            if compression_type == 2:
-                return zlib.decompress(f.read(data_length-1))
-            elif compression_type == 1:
-               return gzip.decompress(f.read(data_length-1))
-            elif compression_type == 3:
-                return f.read(data_length-1)
+        """
+        Reads the chunk from the region file and returns its decompressed NBT data,
+        or None if the chunk is not in the file.
+        """
+        ind = RegionFile.get_index(offsetX, offsetZ)
+        if not self.present[ind]:
+            return None
+        return self._read_payload(ind)
+    
+    def _payload_span(self, ind : int) -> tuple:
+        """
+        Returns (decompress, start, end) for a chunk, where start and end are the
+        offsets of its compressed data in the file.
+        """
+        if self._map is None:
+            raise ValueError(f'{self.filename} is closed.')
+        start = int(self.offsets[ind]) * 4096
+        data_length, compression_type = _chunk_header_format.unpack_from(self._map, start)
+        decompress = _decompressors.get(compression_type, None)
+        if decompress is None:
+            raise ValueError(f'Unknown compression type {compression_type} for chunk {RegionFile.expand_index(ind)}.')
+        return decompress, start + 5, start + 4 + data_length
+    
+    def _read_payload(self, ind : int) -> bytes:
+        """
+        Decompresses a chunk's data directly out of the memory map.
+        """
+        decompress, start, end = self._payload_span(ind)
+        # The views are released right away so that the map can be closed.
+        with memoryview(self._map) as view, view[start:end] as data:
+            return decompress(data)
+    
+    def iter_chunks(self, parallel : int = None, executor = None, parse : bool = True):
+        """
+        Yields ((offsetX, offsetZ), data) for every chunk in the file, in the order
+        they are stored in the file.
+        The compressed data is read sequentially, and decompressed (and parsed) by
+        a thread pool. zlib releases the GIL, so decompression runs on as many cores
+        as there are workers. Only a bounded number of chunks are read ahead of the
+        one that is being yielded, so memory use does not grow with the file.
+        : parallel :    The number of worker threads. If None and no executor is
+                        given, every chunk is decompressed on the calling thread.
+        : executor :    A concurrent.futures.Executor to use instead of creating a
+                        thread pool. It is not shut down afterwards.
+        : parse :       If True, data is the chunk's root tag. Otherwise it is the
+                        decompressed NBT data.
+        """
+        present = self.present
+        indices = numpy.flatnonzero(present)
+        indices = indices[numpy.argsort(self.offsets[indices], kind='stable')]
+        starts = self.offsets[indices].astype(numpy.int64)
+        self._prefetch(starts, starts + self.sector_counts[indices])
+        if executor is None and parallel is None:
+            for ind in indices.tolist():
+                yield RegionFile.expand_index(ind), _decode_payload(parse, *self._read_compressed(ind))
+            return
+        owned = executor is None
+        if owned:
+            executor = ThreadPoolExecutor(max_workers=parallel)
+        limit = 2 * (parallel or os.cpu_count() or 1)
+        pending = deque()
+        try:
+            for ind in indices.tolist():
+                pending.append((ind, executor.submit(_decode_payload, parse, *self._read_compressed(ind))))
+                if len(pending) >= limit:
+                    ind, future = pending.popleft()
+                    yield RegionFile.expand_index(ind), future.result()
+            while pending:
+                ind, future = pending.popleft()
+                yield RegionFile.expand_index(ind), future.result()
+        finally:
+            for _, future in pending:
+                future.cancel()
+            if owned:
+                executor.shutdown()
+    
+    def _read_compressed(self, ind : int) -> tuple:
+        """
+        Returns (decompress, data) for a chunk, with the compressed data copied out
+        of the memory map so that it can be handed to another thread.
+        """
+        decompress, start, end = self._payload_span(ind)
+        return decompress, self._map[start:end]
+    
+    def load_all(self, executor = None, workers : int = None) -> dict:
+        """
+        Loads every chunk in the file into loaded_chunks, decompressing and parsing
+        them in parallel. See iter_chunks.
+        : executor :    A concurrent.futures.Executor to use.
+        : workers :     The number of worker threads to use if no executor is given.
+                        If both are None, chunks are loaded on the calling thread.
+        Returns loaded_chunks.
+        """
+        for coord, tag in self.iter_chunks(workers, executor):
+            # Chunks are built on this thread, since building them registers block states.
+            if coord not in self.loaded_chunks:
+                self.loaded_chunks[coord] = chunk.Chunk(tag)
+                self.loaded_indices.add(RegionFile.get_index(*coord))
+        return self.loaded_chunks
     
     def has_chunk(self, offsetX : int, offsetZ : int) -> bool:
-        if not os.path.exists(self.filename):
-            raise FileNotFoundError(self.filename)
-        ind = ((offsetX & 31) + (offsetZ & 31) * 32)
-        with open(self.filename, 'rb') as f:
-            f.seek(ind * 4)
-            return int.from_bytes(f.read(4), 'big') != 0
\ No newline at end of file
+        return bool(self.present[RegionFile.get_index(offsetX, offsetZ)])
\ No newline at end of file